@@ -1,9 +1,11 @@
 import discord
 from discord.ext import commands
 from discord import Message, Emoji, User, Guild, TextChannel, CategoryChannel, \
-    DMChannel, Embed
+    DMChannel, Embed, PartialMessage
 import sys
 import os
+import asyncio
+import time
 import unicodedata as ud
 from message_sequences.message_sequence_example import MessageSequenceTest
 from message_sequences.new_game_sequence import NewGameSequence
@@ -11,10 +13,16 @@ from message import UserMessageStates, MessageSequence
 from unicode_constants import UNICODE_FORWARD_ARROW, UNICODE_1, \
     START_GAME_EMOJI, UNICODE_2, UNICODE_3, UNICODE_4, UNICODE_5, UNICODE_6, \
     UNICODE_0
-from db.property_constants import CREATE_GAME_CHANNEL, JOIN_GAME_CHANNEL, \
-    GAME_CATEGORY_PROPERTY_NAME
 from db.dbfacade import DatabaseFacade
 from db.model import Game
+from routing import message_routes, MessageRoute, MessageKind
+from guild_config import guild_configs
+from game_locks import game_locks
+from notices import channel_notices
+from summaries import GameSummaries
+from channel_pool import channel_pool
+from display_names import DisplayNameResolver
+from game_modes import mode_registry, read_game_modes_file
 import random
 
 
@@ -23,11 +31,36 @@ intent = discord.Intents().all()
 bot = commands.Bot(command_prefix='!', intent=intent)
 
 # message sequence related code
-message_states = UserMessageStates()
+message_states = UserMessageStates(
+    client=bot,
+    sequence_types=[NewGameSequence, MessageSequenceTest]
+)
+sequence_sweeper: asyncio.Task = None
+
+# display names for rendering rosters
+name_resolver = DisplayNameResolver(bot)
+
+# keeps the summary embeds of games current as their rosters change
+game_summaries = GameSummaries(bot)
+
+# The database is set up while the bot logs in, see main(). Every event
+# handler that touches the database, or the routes and configs loaded from
+# it, waits on this first.
+database_ready = asyncio.Event()
+startup_began: float = None
 
 
 CONNECTION_STRING = os.getenv("DATABASE_URL")
 BOT_TOKEN = os.getenv("TOKEN")
+# set to log every SQL statement
+DATABASE_ECHO = os.getenv("DATABASE_ECHO") is not None
+# JSON file of game modes to add to the defaults, see read_game_modes_file
+GAME_MODES_FILE = os.getenv("GAME_MODES_FILE")
+# spare game channels to keep ready in each guild; 0 turns the pool off
+channel_pool.size = int(os.getenv("CHANNEL_POOL_SIZE", "2"))
+# set to let players into game channels through a role per game, instead of
+# a permission overwrite per player
+channel_pool.use_roles = os.getenv("GAME_ROLES") is not None
 
 # some command line args provided
 if len(sys.argv) > 1:
@@ -35,7 +68,7 @@ if len(sys.argv) > 1:
     # setting up the database connection string
     if len(sys.argv) == 3:
         BOT_TOKEN = sys.argv[1]
-        database = DatabaseFacade(connection_string=sys.argv[2])
+        CONNECTION_STRING = sys.argv[2]
     else:
         print(
             "Incorrect number of args; requires connection string in position 2"
@@ -52,10 +85,6 @@ elif len(sys.argv) == 1:
             " missing"
         )
         exit()
-    else:
-        # getenv found something; will crash later if invalid token.
-        database = DatabaseFacade(connection_string=CONNECTION_STRING)
-
 
     # establish that a bot token is available.
     if BOT_TOKEN is None:
@@ -74,6 +103,39 @@ async def is_admin(context: commands.Context):
     return user_permissions.administrator or ("admin" in user_role_names)
 
 
+async def init_database():
+    """
+    Creates the DatabaseFacade, which blocks on table creation, migrations and
+    seeding, on a worker thread so that the gateway login runs meanwhile. Then
+    loads everything the event handlers look things up in; gateway events
+    arrive before on_ready, so all of it has to be in place before they are
+    let through.
+    """
+    def setup():
+        # extra modes are seeded into the modes table along with the defaults
+        if GAME_MODES_FILE is not None:
+            mode_registry.load(
+                list(mode_registry) + read_game_modes_file(GAME_MODES_FILE)
+            )
+        DatabaseFacade(
+            connection_string=CONNECTION_STRING,
+            echo=DATABASE_ECHO
+        )
+
+    try:
+        await bot.loop.run_in_executor(None, setup)
+        await message_routes.load()
+        await guild_configs.load()
+        channel_pool.load()
+    except Exception as e:
+        print(f"ERROR: database setup got exception of type {type(e)}: {e}")
+        await bot.close()
+        return
+
+    print(f"Database ready after {time.monotonic() - startup_began:.2f}s")
+    database_ready.set()
+
+
 @bot.event
 async def on_connect():
     print("Connected")
@@ -81,7 +143,17 @@ async def on_connect():
 
 @bot.event
 async def on_ready():
-    print("Ready")
+    global sequence_sweeper
+    await database_ready.wait()
+
+    for guild in bot.guilds:
+        channel_pool.refill(guild)
+
+    # on_ready fires again after every reconnect
+    if sequence_sweeper is None:
+        sequence_sweeper = bot.loop.create_task(message_states.run_sweeper())
+
+    print(f"Ready after {time.monotonic() - startup_began:.2f}s")
 
 
 @bot.event
@@ -106,6 +178,17 @@ async def on_reaction_add(reaction: discord.Reaction, user: discord.User):
 @bot.event
 async def on_message(message: discord.Message):
     print(message.content, ":", len(message.content))
+    await database_ready.wait()
+
+    # a sequence saved before a restart is brought back first, so that it
+    # sees this message too
+    if isinstance(message.channel, DMChannel):
+        await message_states.load_user_sequence(message.channel.recipient)
+
+    # sequences check text replies against the newest message in their DM
+    # channel, which includes the bot's own messages.
+    message_states.observe_message(message)
+
     if not message.author.bot:
         author_name = message.author.name
         channel: discord.TextChannel = message.channel
@@ -122,11 +205,13 @@ async def on_message(message: discord.Message):
             content
         ))
 
-        message_sequence: MessageSequenceTest \
-            = message_states.get_user_sequence(message.author)
+        # sequences only run in DMs
+        if isinstance(channel, DMChannel):
+            message_sequence: MessageSequenceTest \
+                = message_states.get_user_sequence(message.author)
 
-        if message_sequence is not None:
-            await message_sequence.run_next_handler(message)
+            if message_sequence is not None:
+                await message_sequence.run_next_handler(message)
 
     # overriding on_message stops the bot from processing @bot.command()
     # functions. So we have to call this instead if we want messages to be
@@ -147,144 +232,151 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     # print(payload.emoji.name, "?=", UNICODE_1, ":", payload.emoji.name == UNICODE_1)
     # print("payload channel: {}".format(payload.channel_id))
 
-    guild: Guild = bot.get_guild(payload.guild_id)
+    if user is None or user.bot:
+        return
+
+    # routes and sequences are only known once the database is up
+    await database_ready.wait()
 
     # Looks like all possible send targets inherit from Messageable, and EITHER
     # GuildChannel or PrivateChannel (all 3 of which are in discord.abc)
     channel: discord.TextChannel = bot.get_channel(payload.channel_id)
-    print(f"channel: {channel}")
-    message: Message = await channel.fetch_message(payload.message_id)
 
-    if not user.bot:
+    if payload.guild_id is None:
+        print("checked as DMChannel")
+        message_sequence: MessageSequenceTest \
+            = await message_states.load_user_sequence(user)
 
-        create_game_prop = DatabaseFacade.get_property(
-            property_name=CREATE_GAME_CHANNEL
-        )
+        # only the message the user's sequence is waiting on is of interest;
+        # anything else is dropped before we go to discord for it.
+        if message_sequence is None \
+                or message_sequence.current_message is None \
+                or message_sequence.current_message.id != payload.message_id:
+            return
 
-        # if the above evaluated true, then channel should have a name
-        # attribute at this point.
-        create_game_channel_name = create_game_prop.value
+        if channel is None:
+            channel = await user.create_dm()
+        message: Message = await channel.fetch_message(payload.message_id)
 
-        join_game_prop = DatabaseFacade.get_property(
-            property_name=JOIN_GAME_CHANNEL
-        )
+        # pass the message along to the sequence's handler
+        await message_sequence.run_next_handler(message)
+        return
 
-        join_game_channel_name = join_game_prop.value
+    route: MessageRoute = message_routes.get(payload.message_id)
+    if route is None:
+        return
 
-        if type(channel) == DMChannel:
-            print("checked as DMChannel")
-            message_sequence: MessageSequenceTest \
-                = message_states.get_user_sequence(user)
+    guild: Guild = bot.get_guild(payload.guild_id)
+    print(f"channel: {channel}")
 
-            # if the user has a sequence with the bot already...
-            if message_sequence is not None:
-                # pass the message along to the sequence's handler
-                await message_sequence.run_next_handler(message)
-                return
-            # otherwise... just ignore them I think?
-            else:
-                return
-        # this is the message the bot put in the create a game channel
-        elif channel.name == create_game_channel_name:
-            print("checked as a create game message")
-            reactions = message.reactions
-            for reaction in reactions:
-                try:
-                    await message.remove_reaction(reaction.emoji, user)
-                except Exception as e:
-                    print(f"ERROR: While removing reaction, got exception of "
-                          f"type {type(e)}")
-
-            new_game_sequence = NewGameSequence(user, guild)
-            await message_states.add_user_sequence(user, new_game_sequence)
-            await new_game_sequence.start_sequence()
-        elif channel.name == join_game_channel_name:
-            print("checked as a join game message")
-            # reaction was added on a message in the games channel
-            game: Game = DatabaseFacade.get_game_by_message_did(
-                str(message.id)
+    # none of the guild message handlers read the message itself, so all of
+    # them can work off a partial message instead of fetching it.
+    message: PartialMessage = channel.get_partial_message(payload.message_id)
+
+    # this is the message the bot put in the create a game channel
+    if route.kind == MessageKind.CREATE_GAME:
+        print("checked as a create game message")
+        try:
+            await message.remove_reaction(payload.emoji, user)
+        except Exception as e:
+            print(f"ERROR: While removing reaction, got exception of "
+                  f"type {type(e)}")
+
+        new_game_sequence = NewGameSequence(user, guild)
+        await message_states.add_user_sequence(user, new_game_sequence)
+        await new_game_sequence.start_sequence()
+    elif route.kind == MessageKind.JOIN_GAME:
+        print("checked as a join game message")
+        # reaction was added on a message in the games channel
+        player_id = await DatabaseFacade.get_player_id_by_did(str(user.id))
+
+        # the fill check and the join have to happen as one step
+        async with game_locks.hold(route.game_id):
+            game: Game = await DatabaseFacade.get_game_by_id(
+                route.game_id,
+                profile="teams"
             )
-
-            user_as_player = DatabaseFacade.get_player_by_did(str(user.id))
-            if game is not None:
-                DatabaseFacade.add_player_to_game(game.id, user_as_player)
-                game_channel: TextChannel = bot.get_channel(int(game.channel_id))
-                await game_channel.set_permissions(
-                    user,
-                    read_messages=True
-                )
-
-                if game.is_full():
-                    print("game is full, clearing all messages")
-                    await message.clear_reactions()
-            else:
-                print(f"Game not found with message_did: {message.id}")
-
-        # this should become a check against all of the game's private channel
-        # messages, which I'll probably build team swapping into
-        elif channel.category.name == DatabaseFacade.get_property(
-                GAME_CATEGORY_PROPERTY_NAME
-        ).value:
-            print("CHECKED as a channel in the game category")
-            if message.author.bot:
-                game: Game = DatabaseFacade.get_game_by_game_message_did(
-                    str(message.id)
+            if game is not None and game.is_full():
+                print(f"Game {game.id} is full; "
+                      f"not adding {user.display_name}")
+                return
+            elif game is not None:
+                game = await DatabaseFacade.add_player_to_game(
+                    game.id,
+                    player_id
                 )
-
-                user_as_player = DatabaseFacade.get_player_by_did(str(user.id))
-
-                emoji_name = payload.emoji.name
-                print("")
-                if emoji_name == UNICODE_0:
-                    team_number = 0
-                elif emoji_name == UNICODE_1:
-                    team_number = 1
-                elif emoji_name == UNICODE_2:
-                    team_number = 2
-                elif emoji_name == UNICODE_3:
-                    team_number = 3
-                elif emoji_name == UNICODE_4:
-                    team_number = 4
-                elif emoji_name == UNICODE_5:
-                    team_number = 5
-                elif emoji_name == UNICODE_6:
-                    team_number = 6
-                else:
-                    print(f"React with bad emoji: {emoji_name}")
-                    try:
-                        await message.remove_reaction(payload.emoji, user)
-                    except Exception as e:
-                        print(
-                            f"ERROR: While removing reaction, got exception of "
-                            f"type {type(e)}")
-
+                # the game filled up, or kept changing, in another process
+                if game is None:
+                    print(f"Could not add {user.display_name} to game "
+                          f"{route.game_id}")
                     return
 
-                if DatabaseFacade.add_player_to_team(
-                    game.id,
-                    team_number,
-                    user_as_player
-                ):
-                    await channel.send(
-                        content=f"{user.display_name} joined team "
-                        f"{team_number}"
-                    )
-                else:
-                    await channel.send(
-                        content=f"Could not add {user.display_name} to team "
-                        f"{team_number}: team is full or does not exist."
-                    )
+        if game is not None:
+            game_summaries.refresh(game.id)
+            await channel_pool.game_channel(guild, game).let_in(user)
+
+            if game.is_full():
+                print("game is full, clearing all messages")
+                await message.clear_reactions()
+        else:
+            print(f"Game not found with message_did: {message.id}")
+
+    # the summary message in a game's own channel, which is used for team
+    # swapping
+    elif route.kind == MessageKind.GAME_SUMMARY:
+        print("CHECKED as a game summary message")
+        player_id = await DatabaseFacade.get_player_id_by_did(str(user.id))
+
+        emoji_name = payload.emoji.name
+        print("")
+        if emoji_name == UNICODE_0:
+            team_number = 0
+        elif emoji_name == UNICODE_1:
+            team_number = 1
+        elif emoji_name == UNICODE_2:
+            team_number = 2
+        elif emoji_name == UNICODE_3:
+            team_number = 3
+        elif emoji_name == UNICODE_4:
+            team_number = 4
+        elif emoji_name == UNICODE_5:
+            team_number = 5
+        elif emoji_name == UNICODE_6:
+            team_number = 6
+        else:
+            print(f"React with bad emoji: {emoji_name}")
+            try:
+                await message.remove_reaction(payload.emoji, user)
+            except Exception as e:
+                print(
+                    f"ERROR: While removing reaction, got exception of "
+                    f"type {type(e)}")
 
-                try:
-                    await message.remove_reaction(payload.emoji, user)
-                except Exception as e:
-                    print(f"ERROR: While removing reaction, got exception of "
-                          f"type {type(e)}")
+            return
 
+        async with game_locks.hold(route.game_id):
+            added = await DatabaseFacade.add_player_to_team(
+                route.game_id,
+                team_number,
+                player_id
+            )
 
+        # the roster in the summary shows who is on which team; only refusals
+        # are posted, and a burst of them as one message
+        if added:
+            game_summaries.refresh(route.game_id)
         else:
-            print("CHECKED as other message")
+            channel_notices.post(
+                channel,
+                f"Could not add {user.display_name} to team "
+                f"{team_number}: team is full or does not exist."
+            )
 
+        try:
+            await message.remove_reaction(payload.emoji, user)
+        except Exception as e:
+            print(f"ERROR: While removing reaction, got exception of "
+                  f"type {type(e)}")
 
 
 @bot.command()
@@ -326,8 +418,10 @@ async def scrims(context: commands.Context, *args):
     # with users
     await msg.add_reaction(UNICODE_FORWARD_ARROW)
 
-    # TODO: message ID will come in useful later when tracking which message
-    #  was reacted to.
+    # reactions are routed by message ID, so the new message has to be known
+    # before anyone can use it.
+    await message_routes.add_create_message(msg.id)
+    await guild_configs.update(context.guild, create_channel=context.channel)
     print("Message ID: " + str(msg.id))
 
 
@@ -392,7 +486,7 @@ async def showgame(context: commands.Context, game_id: str):
         await context.send("usage: !game <game_id>")
         return
 
-    retrieved_game = DatabaseFacade.get_game_by_id(game_id)
+    retrieved_game = await DatabaseFacade.get_game_by_id(game_id)
     await context.send("Game loaded:\n" + str(retrieved_game))
     return
 
@@ -460,7 +554,7 @@ async def pchannel(context: commands.Context, channel_name: str,
 @commands.check(is_admin)
 async def prop(context: commands.Context, prop_name: str, prop_value: str=None):
     if prop_value is None:
-        prop = DatabaseFacade.get_property(prop_name)
+        prop = await DatabaseFacade.get_property(prop_name)
         if prop is not None:
             await context.send(
                 content=f"Value: {prop.value}"
@@ -468,37 +562,100 @@ async def prop(context: commands.Context, prop_name: str, prop_value: str=None):
         else:
             await context.send(f"Property undefined: {prop_name}")
     else:
-        DatabaseFacade.set_property(prop_name, prop_value)
+        await DatabaseFacade.set_property(prop_name, prop_value)
         await context.send(
             content=f"set property {prop_name} to {prop_value}"
         )
 
 
+@bot.command()
+@commands.check(is_admin)
+async def setup(context: commands.Context, setting: str = None, *args):
+    """
+    Run in the channel to use: '!setup join' for game announcements,
+    '!setup category' for the category game channels go in, or '!setup create'
+    for !scrims messages. '!setup' alone shows the current channels.
+    """
+    if len(args) > 0 or context.guild is None:
+        await context.send("usage: !setup [join|category|create]")
+        return
+
+    if setting == "join":
+        await guild_configs.update(context.guild, join_channel=context.channel)
+    elif setting == "category":
+        if context.channel.category is None:
+            await context.send("This channel is not in a category")
+            return
+        await guild_configs.update(
+            context.guild,
+            game_category=context.channel.category
+        )
+        # the pool only keeps spares once there is a category to keep them in
+        channel_pool.refill(context.guild)
+    elif setting == "create":
+        await guild_configs.update(
+            context.guild,
+            create_channel=context.channel
+        )
+    elif setting is not None:
+        await context.send("usage: !setup [join|category|create]")
+        return
+
+    await context.send(
+        content=f"create channel: "
+                f"{await guild_configs.create_channel(context.guild)}\n"
+                f"join channel: "
+                f"{await guild_configs.join_channel(context.guild)}\n"
+                f"game category: "
+                f"{await guild_configs.game_category(context.guild)}"
+    )
+
+
+@bot.command()
+@commands.check(is_admin)
+async def stats(context: commands.Context, *args):
+    if len(args) > 0:
+        await context.send("'!stats' command does not accept arguments")
+        return
+
+    await context.send(
+        content="\n".join([
+            DatabaseFacade.property_cache.stats(),
+            DatabaseFacade.player_id_cache.stats(),
+            message_states.stats(),
+            game_locks.stats(),
+            channel_notices.stats(),
+            game_summaries.stats(),
+            channel_pool.stats(),
+        ])
+    )
+
+
 @bot.command()
 async def leave(context: commands.Context, *args):
     channel_did = str(context.channel.id)
-    game: Game = DatabaseFacade.get_game_by_channel_did(channel_did)
+    game: Game = await DatabaseFacade.get_game_by_channel_did(
+        channel_did,
+        profile="bare"
+    )
     if game is not None:
         if len(args) > 0:
             await context.send("Usage: !leave")
             return
         player_did = str(context.author.id)
-        leaver = DatabaseFacade.get_player_by_did(player_did=player_did)
+        leaver_id = await DatabaseFacade.get_player_id_by_did(player_did)
 
-        if leaver.id == game.creator_id:
+        if leaver_id == game.creator_id:
             await context.send("The creator cannot leave the game; use !delete"
                                " to remove the game instead.")
             return
 
-        DatabaseFacade.remove_player_from_game(game.id, leaver)
-
-        game_channel_id: int = int(game.channel_id)
+        async with game_locks.hold(game.id):
+            await DatabaseFacade.remove_player_from_game(game.id, leaver_id)
+        game_summaries.refresh(game.id)
 
-        game_channel: TextChannel = bot.get_channel(game_channel_id)
-
-        await game_channel.set_permissions(
-            context.author,
-            read_messages=False
+        await channel_pool.game_channel(context.guild, game).let_out(
+            context.author
         )
 
         print("leave functioned properly so far....")
@@ -515,7 +672,10 @@ async def leave(context: commands.Context, *args):
 @bot.command()
 async def kick(context: commands.Context, mentioned: User, *args):
     channel_did = str(context.channel.id)
-    game: Game = DatabaseFacade.get_game_by_channel_did(channel_did)
+    game: Game = await DatabaseFacade.get_game_by_channel_did(
+        channel_did,
+        profile="bare"
+    )
     if game is not None:
         if len(args) > 0:
             await context.send("usage: !kick <@user>\nCan only be used by the"
@@ -524,34 +684,36 @@ async def kick(context: commands.Context, mentioned: User, *args):
         else:
 
             caller_did = str(context.author.id)
-            caller = DatabaseFacade.get_player_by_did(caller_did)
+            caller_id = await DatabaseFacade.get_player_id_by_did(caller_did)
 
-            if caller.id != game.creator_id:
+            if caller_id != game.creator_id:
                 await context.send("!kick can only be used by the creator.")
                 return
 
             mentioned_did = str(mentioned.id)
-            kicked = DatabaseFacade.get_player_by_did(mentioned_did)
+            kicked_id = await DatabaseFacade.get_player_id_by_did(mentioned_did)
 
-            if kicked.id == game.creator.id:
+            if kicked_id == game.creator_id:
                 await context.send(
                     "!kick cannot be used to remove the creator"
                 )
                 return
 
-            success = DatabaseFacade.remove_player_from_game(game.id, kicked)
+            async with game_locks.hold(game.id):
+                success = await DatabaseFacade.remove_player_from_game(
+                    game.id,
+                    kicked_id
+                )
 
             if not success:
                 await context.send(
                     f"Cannot kick user {mentioned.name}; user is not in game"
                 )
                 return
+            game_summaries.refresh(game.id)
 
-            game_channel: TextChannel = bot.get_channel(context.channel.id)
-
-            await game_channel.set_permissions(
-                mentioned,
-                read_messages=False
+            await channel_pool.game_channel(context.guild, game).let_out(
+                mentioned
             )
 
             await context.send(
@@ -562,7 +724,10 @@ async def kick(context: commands.Context, mentioned: User, *args):
 @bot.command()
 async def delete(context: commands.Context, *args):
     channel_did = str(context.channel.id)
-    game: Game = DatabaseFacade.get_game_by_channel_did(channel_did)
+    game: Game = await DatabaseFacade.get_game_by_channel_did(
+        channel_did,
+        profile="bare"
+    )
     if game is not None:
         if len(args) > 0:
             await context.send("usage: !delete")
@@ -570,42 +735,68 @@ async def delete(context: commands.Context, *args):
         else:
 
             caller_did = str(context.author.id)
-            caller = DatabaseFacade.get_player_by_did(caller_did)
-
-            join_game_message_id = int(game.message_did)
-            print(f"looking for join message with id {join_game_message_id}")
+            caller_id = await DatabaseFacade.get_player_id_by_did(caller_did)
 
-            join_game_channel_prop = DatabaseFacade.get_property(
-                JOIN_GAME_CHANNEL
-            )
+            if caller_id != game.creator_id:
+                await context.send("Only the creator can delete a game")
+                return
 
-            join_game_channel = discord.utils.find(
-                lambda channel: channel.name == join_game_channel_prop.value,
-                context.guild.text_channels
-            )
-            print(f"got join channel with name {join_game_channel.name}")
+            # games whose announcement never went out have no join message
+            join_game_message: PartialMessage = None
+            if game.message_did:
+                join_game_message_id = int(game.message_did)
+                print(f"looking for join message with id "
+                      f"{join_game_message_id}")
 
-            join_game_message = await join_game_channel.fetch_message(
-                join_game_message_id
-            )
+                if game.message_channel_id is not None:
+                    join_game_channel: TextChannel = bot.get_channel(
+                        int(game.message_channel_id)
+                    )
+                else:
+                    # games from before the join channel was stored with them
+                    join_game_channel = await guild_configs.join_channel(
+                        context.guild
+                    )
 
-            if caller.id != game.creator_id:
-                await context.send("Only the creator can delete a game")
-                return
+                if join_game_channel is None:
+                    # the game's channel is about to go, so not in there
+                    await context.author.send(
+                        f"Could not find the channel game {game.id} was "
+                        f"announced in, so its announcement was left up. An "
+                        f"admin can set the channel with '!setup join'."
+                    )
+                else:
+                    print(f"got join channel with name "
+                          f"{join_game_channel.name}")
+                    join_game_message = join_game_channel.get_partial_message(
+                        join_game_message_id
+                    )
 
-            DatabaseFacade.delete_game_by_id(game.id)
+            async with game_locks.hold(game.id):
+                await DatabaseFacade.delete_game_by_id(game.id)
+                message_routes.remove_game(game.id)
 
-            print(f"deleting channel {context.channel.name}")
-            await context.channel.delete()
+            print(f"releasing channel {context.channel.name}")
+            await channel_pool.release(
+                channel_pool.game_channel(context.guild, game)
+            )
 
+            if join_game_message is None:
+                return
             print(f"join_game_message has id")
-            await join_game_message.delete()
+            try:
+                await join_game_message.delete()
+            except discord.NotFound:
+                print(f"join message {join_game_message.id} already deleted")
             return
 
 
 @bot.command()
 async def teams(context: commands.Context):
-    game: Game = DatabaseFacade.get_game_by_channel_did(str(context.channel.id))
+    game: Game = await DatabaseFacade.get_game_by_channel_did(
+        str(context.channel.id),
+        profile="roster"
+    )
     if game is not None:
         reply = f"#######Game {game.id}#######\n"
         if len(game.teams) == 1:
@@ -615,6 +806,11 @@ async def teams(context: commands.Context):
                 f"Teams will be randomized when the game is started (use"
                 f" {bot.command_prefix}start to start it)")
         else:
+            player_names = await name_resolver.resolve(
+                context.guild,
+                [int(player.did) for team in game.teams
+                 for player in team.players]
+            )
             for team in game.teams[1:]:
                 if team.number == 0:
                     reply += "Undecided:\n"
@@ -622,8 +818,7 @@ async def teams(context: commands.Context):
                     reply += f"Team {team.number}:\n"
 
                 for player in team.players:
-                    user: User = await bot.fetch_user(int(player.did))
-                    reply += f" - {user.display_name}\n"
+                    reply += f" - {player_names[int(player.did)]}\n"
 
         await context.send(reply)
     else:
@@ -632,48 +827,73 @@ async def teams(context: commands.Context):
 
 @bot.command()
 async def start(context: commands.Context):
-    game: Game = DatabaseFacade.get_game_by_channel_did(str(context.channel.id))
-    if game.player_number != game.teams[0].size:
-        await context.send("Cannot start game until game is full "
-                           f"(current: {game.player_number}, "
-                           f"needed: {game.teams[0].size})")
-        # return
-    elif game is not None:
-        DatabaseFacade.start_game(game.id)
-
-    start_embed = Embed()
-    start_embed.title = "Starting game..."
-    start_embed.description = (
-            f"Game begun at {game.started_at} with teams:"
+    game: Game = await DatabaseFacade.get_game_by_channel_did(
+        str(context.channel.id),
+        profile="bare"
     )
-    print("counting teams: ", len(game.teams))
+    if game is None:
+        await context.send("This channel no longer has an associated game")
+        return
 
-    if game.teams_available:
-        if game.randomize_teams:
+    # the fill check, the team shuffle and the start have to happen as one
+    # step
+    async with game_locks.hold(game.id):
+        game = await DatabaseFacade.get_game_by_id(game.id, profile="roster")
+        if game.player_number != game.teams[0].size:
+            await context.send("Cannot start game until game is full "
+                               f"(current: {game.player_number}, "
+                               f"needed: {game.teams[0].size})")
+            return
+
+        if game.teams_available and game.randomize_teams:
+            # Each add_player_to_team runs in a session of its own, so the
+            # teams loaded above never see the moves; who is still left to
+            # place is kept track of here instead.
+            unplaced = list(game.teams[0].players)
             for team in game.teams[1:]:
                 empty_slots = team.size - len(team.players)
-                if empty_slots > len(game.teams[0].players):
+                if empty_slots > len(unplaced):
                     await context.send(f"ERROR: Insufficient number of players "
                                        f"to fill teams; ran out on team "
                                        f"{team.number}")
-                players = random.sample(game.teams[0].players, k=empty_slots)
-                for player in players:
+                    return
+                for player in random.sample(unplaced, k=empty_slots):
+                    unplaced.remove(player)
                     print(f"adding player {player.id} to team {team.number}")
-                    DatabaseFacade.add_player_to_team(
+                    await DatabaseFacade.add_player_to_team(
                         game.id,
                         team.number,
-                        player
+                        player.id
                     )
-        else:
-            if sum([len(team.players) for team in game.teams[1:]])<len(game.teams[0]):
-                await context.send("All players must be in a team before game can"
-                                   " begin")
-                return
+        elif game.teams_available and len(game.teams[0].players) > 0:
+            # anyone left on team 0 hasn't picked a team
+            await context.send("All players must be in a team before game can"
+                               " begin")
+            return
+
+        await DatabaseFacade.start_game(game.id)
+        # the teams we loaded are a snapshot from before the shuffle
+        game = await DatabaseFacade.get_game_by_id(game.id, profile="roster")
+
+    game_summaries.refresh(game.id)
+
+    start_embed = Embed()
+    start_embed.title = "Starting game..."
+    start_embed.description = (
+            f"Game begun at {game.started_at} with teams:"
+    )
+    print("counting teams: ", len(game.teams))
+
+    if game.teams_available:
+        all_names = await name_resolver.resolve(
+            context.guild,
+            [int(player.did) for team in game.teams for player in team.players]
+        )
 
         for team in game.teams[1:]:
-            print("Players:", team.players, ":", int(team.players[0].did))
+            print("Players:", team.players)
             player_names = [
-                await bot.fetch_user(int(player.did)).name for player in team.players
+                all_names[int(player.did)] for player in team.players
             ]
 
             if len(player_names) > 0:
@@ -686,11 +906,11 @@ async def start(context: commands.Context):
                 inline=False
             )
     else:
-        player_names = [
-            await bot.fetch_user(int(player.did)).name
-            for player
-            in game.teams[0].players
-        ]
+        all_names = await name_resolver.resolve(
+            context.guild,
+            [int(player.did) for player in game.teams[0].players]
+        )
+        player_names = list(all_names.values())
         if len(player_names) > 0:
             player_string = "\n".join(player_names)
         else:
@@ -711,9 +931,13 @@ async def test(context: commands.Context, arg: str):
 
 
 def main():
+    global startup_began
 
     print("Using bot_token: " + BOT_TOKEN)
 
+    # bot.run drives bot.loop, so this runs alongside the login
+    startup_began = time.monotonic()
+    bot.loop.create_task(init_database())
     bot.run(BOT_TOKEN)
 
 
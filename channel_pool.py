@@ -0,0 +1,311 @@
+import asyncio
+from datetime import datetime, timedelta
+from discord import Guild, TextChannel, Role, User, PermissionOverwrite, \
+    HTTPException, CategoryChannel
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from db.dbfacade import DatabaseFacade
+from db.model import Game
+from guild_config import guild_configs
+
+
+# what a spare channel, and its role, are called until a game gets them
+SPARE_CHANNEL_NAME = "game-spare"
+
+# Messages older than this can't be bulk deleted, so purging them takes a
+# request each; a channel holding any is replaced instead of wiped.
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+
+
+class GameChannel(NamedTuple):
+    """
+    A game's channel, and its role if the game has one. With a role, access
+    to the channel comes from holding the role, and the channel's overwrites
+    never change; without one, every player gets an overwrite of their own.
+    """
+    channel: TextChannel
+    role: Optional[Role]
+
+    async def let_in(self, user: User) -> None:
+        if self.role is not None:
+            member = await self._member(user)
+            await member.add_roles(self.role)
+        else:
+            await self.channel.set_permissions(user, read_messages=True)
+
+    async def let_out(self, user: User) -> None:
+        if self.role is not None:
+            member = await self._member(user)
+            await member.remove_roles(self.role)
+        else:
+            await self.channel.set_permissions(user, read_messages=False)
+
+    async def _member(self, user: User):
+        guild = self.channel.guild
+        member = guild.get_member(user.id)
+        if member is None:
+            member = await guild.fetch_member(user.id)
+        return member
+
+
+class ChannelPool:
+    """
+    Hidden text channels in the game category, created ahead of time so that
+    a new game gets its channel without waiting on channel creation. Taking a
+    channel from the pool costs nothing; the pool is topped back up to size
+    in the background. Deleted games hand their channel back to be wiped and
+    reused, and it is only destroyed if the pool is already full.
+
+    With use_roles set, each channel comes with a role that can see it, and
+    players are let in by giving them the role; see GameChannel.
+
+    Spare channels are kept per guild, in the guild's config row, so they
+    survive a restart. A size of 0 turns pooling off. Guilds without a game
+    category set up get no spares, since those would sit at the top of the
+    guild's channel list; their games' channels are created as needed.
+    """
+
+    def __init__(self, size: int = 2, use_roles: bool = False):
+        self.size = size
+        self.use_roles = use_roles
+
+        # guild id -> (channel id, role id or None) of each spare, oldest
+        # first
+        self.spares: Dict[int, List[Tuple[int, Optional[int]]]] = {}
+        self.refills: Dict[int, asyncio.Task] = {}
+        self.loaded = False
+
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+
+    def load(self) -> None:
+        """
+        Picks up the spare channels recorded in the guild configs; run once,
+        after guild_configs.load().
+        """
+        if self.loaded:
+            return
+        self.loaded = True
+
+        for guild_id, guild_config in guild_configs.configs.items():
+            spares = []
+            # "channel:role", or just "channel" for spares without a role
+            for spare in (guild_config.spare_channel_dids or "").split():
+                channel_did, _, role_did = spare.partition(":")
+                spares.append((
+                    int(channel_did),
+                    int(role_did) if role_did else None
+                ))
+            self.spares[guild_id] = spares
+
+    @staticmethod
+    def game_channel(guild: Guild, game: Game) -> GameChannel:
+        role = None
+        if game.role_did is not None:
+            role = guild.get_role(int(game.role_did))
+        return GameChannel(guild.get_channel(int(game.channel_id)), role)
+
+    async def acquire(self, guild: Guild, name: str) -> GameChannel:
+        """
+        Hands out a spare channel, renamed to name in the background, or
+        creates one if the pool is empty. Either way the pool is refilled.
+        """
+        category = await guild_configs.game_category(guild)
+        if category is None:
+            self.misses += 1
+            return await self._create(guild, name, category)
+
+        spares = self.spares.setdefault(guild.id, [])
+        game_channel = None
+        while game_channel is None and len(spares) > 0:
+            channel_id, role_id = spares.pop(0)
+            channel = guild.get_channel(channel_id)
+            # channels deleted by hand are skipped
+            if channel is not None:
+                role = guild.get_role(role_id) if role_id is not None else None
+                game_channel = GameChannel(channel, role)
+
+        if game_channel is not None:
+            self.hits += 1
+            await self._save(guild)
+            asyncio.get_event_loop().create_task(
+                self._rename(game_channel, name, category)
+            )
+        else:
+            self.misses += 1
+            game_channel = await self._create(guild, name, category)
+
+        self.refill(guild)
+        return game_channel
+
+    async def release(self, game_channel: GameChannel) -> None:
+        """
+        Takes back the channel of a deleted game. It is wiped and hidden in
+        the background, or deleted right away if the pool is full.
+        """
+        guild = game_channel.channel.guild
+        spares = self.spares.setdefault(guild.id, [])
+        if len(spares) >= self.size \
+                or await guild_configs.game_category(guild) is None:
+            await self._delete(game_channel)
+        else:
+            asyncio.get_event_loop().create_task(self._recycle(game_channel))
+
+    def refill(self, guild: Guild) -> None:
+        if guild.id not in self.refills:
+            self.refills[guild.id] = asyncio.get_event_loop().create_task(
+                self._refill(guild)
+            )
+
+    async def _refill(self, guild: Guild) -> None:
+        try:
+            category = await guild_configs.game_category(guild)
+            if category is None:
+                return
+
+            spares = self.spares.setdefault(guild.id, [])
+            while len(spares) < self.size:
+                channel, role = await self._create(
+                    guild,
+                    SPARE_CHANNEL_NAME,
+                    category
+                )
+                spares.append((channel.id, role.id if role else None))
+                await self._save(guild)
+        except Exception as e:
+            print(f"ERROR: while refilling channel pool of guild {guild.id}, "
+                  f"got exception of type {type(e)}")
+        finally:
+            del self.refills[guild.id]
+
+    async def _create(self, guild: Guild, name: str,
+                      category: Optional[CategoryChannel]) -> GameChannel:
+        role = None
+        if self.use_roles:
+            role = await guild.create_role(name=name)
+
+        channel = await guild.create_text_channel(
+            name=name,
+            category=category,
+            overwrites=self._overwrites(guild, role)
+        )
+        return GameChannel(channel, role)
+
+    async def _recycle(self, game_channel: GameChannel) -> None:
+        channel, role = game_channel
+        guild = channel.guild
+        try:
+            if await self._has_old_messages(channel):
+                print(f"Replacing channel {channel.id} instead of wiping it")
+                await self._discard(game_channel)
+                self.refill(guild)
+                return
+
+            await channel.purge(limit=None)
+
+            # Emptying a role takes a call per member, and needs every one of
+            # them cached; swapping it for a fresh one takes two.
+            if role is not None:
+                await role.delete()
+                role = await channel.guild.create_role(name=SPARE_CHANNEL_NAME)
+
+            await channel.edit(
+                name=SPARE_CHANNEL_NAME,
+                overwrites=self._overwrites(channel.guild, role)
+            )
+        except Exception as e:
+            print(f"ERROR: while recycling channel {channel.id}, got exception "
+                  f"of type {type(e)}; deleting it instead")
+            await self._discard(GameChannel(channel, role))
+            return
+
+        # a refill may have topped the pool up in the meantime
+        spares = self.spares.setdefault(guild.id, [])
+        if len(spares) >= self.size:
+            await self._discard(GameChannel(channel, role))
+            return
+
+        self.recycled += 1
+        spares.append((channel.id, role.id if role else None))
+        try:
+            await self._save(guild)
+        except Exception as e:
+            print(f"ERROR: while saving channel pool of guild {guild.id}, "
+                  f"got exception of type {type(e)}")
+
+    @staticmethod
+    async def _has_old_messages(channel: TextChannel) -> bool:
+        async for message in channel.history(limit=1, oldest_first=True):
+            return datetime.utcnow() - message.created_at \
+                > BULK_DELETE_MAX_AGE
+        return False
+
+    @staticmethod
+    async def _delete(game_channel: GameChannel) -> None:
+        await game_channel.channel.delete()
+        if game_channel.role is not None:
+            try:
+                await game_channel.role.delete()
+            except HTTPException as e:
+                print(f"ERROR: while deleting role {game_channel.role.id}, "
+                      f"got exception of type {type(e)}")
+
+    @staticmethod
+    async def _discard(game_channel: GameChannel) -> None:
+        # _delete, for background tasks, which have nobody to raise to
+        try:
+            await ChannelPool._delete(game_channel)
+        except Exception as e:
+            print(f"ERROR: while deleting channel {game_channel.channel.id}, "
+                  f"got exception of type {type(e)}")
+
+    @staticmethod
+    async def _rename(game_channel: GameChannel, name: str,
+                      category: CategoryChannel) -> None:
+        # renames are rate limited hard, and nobody needs the name to be
+        # right before their first look at the channel
+        try:
+            # spares made before the game category last changed are moved
+            # into it, in the same edit
+            if game_channel.channel.category_id != category.id:
+                await game_channel.channel.edit(name=name, category=category)
+            else:
+                await game_channel.channel.edit(name=name)
+            if game_channel.role is not None:
+                await game_channel.role.edit(name=name)
+        except HTTPException as e:
+            print(f"ERROR: while renaming channel {game_channel.channel.id}, "
+                  f"got exception of type {type(e)}")
+
+    @staticmethod
+    def _overwrites(guild: Guild, role: Optional[Role]) -> Dict:
+        overwrites = {
+            guild.default_role: PermissionOverwrite(read_messages=False),
+            guild.me: PermissionOverwrite(read_messages=True),
+        }
+        if role is not None:
+            overwrites[role] = PermissionOverwrite(read_messages=True)
+        return overwrites
+
+    async def _save(self, guild: Guild) -> None:
+        # makes sure the guild has a config row to keep the spares in
+        await guild_configs.get(guild)
+        await DatabaseFacade.set_spare_channel_dids(
+            str(guild.id),
+            " ".join(
+                f"{channel_id}:{role_id}" if role_id is not None
+                else str(channel_id)
+                for channel_id, role_id in self.spares[guild.id]
+            )
+        )
+
+    def stats(self) -> str:
+        spare_count = sum(len(spares) for spares in self.spares.values())
+        return (f"channel pool: {spare_count} spare (size {self.size} per "
+                f"guild{', with roles' if self.use_roles else ''}), "
+                f"{self.hits} hits, {self.misses} misses, "
+                f"{self.recycled} recycled")
+
+
+# shared by bot_core and NewGameSequence
+channel_pool = ChannelPool()
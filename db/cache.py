@@ -0,0 +1,87 @@
+"""
+In-process caches for data the bot reads far more often than it writes.
+Everything here is only correct as long as writes go through DatabaseFacade
+in this process; SyncDatabaseFacade and manual edits bypass them.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+from db.model import Property
+
+
+class PropertyCache:
+    """
+    Write-through cache of the properties table, keyed by property name.
+    Loaded in full at startup, so a name that is absent from the cache after
+    that is also absent from the database, and is cached as None on first
+    lookup.
+    """
+
+    def __init__(self):
+        self.properties: Dict[str, Optional[Property]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, properties: Iterable[Property]) -> None:
+        self.properties = {prop.name: prop for prop in properties}
+
+    def contains(self, property_name: str) -> bool:
+        return property_name in self.properties
+
+    def get(self, property_name: str) -> Optional[Property]:
+        """
+        Looks up a property, counting the hit or miss. None is returned both
+        for a miss and for a cached absent property; use contains() to tell
+        the two apart.
+        """
+        if property_name in self.properties:
+            self.hits += 1
+            return self.properties[property_name]
+        else:
+            self.misses += 1
+            return None
+
+    def put(self, property_name: str, prop: Optional[Property]) -> None:
+        self.properties[property_name] = prop
+
+    def stats(self) -> str:
+        return (f"properties: {len(self.properties)} cached, "
+                f"{self.hits} hits, {self.misses} misses")
+
+
+class PlayerIdCache:
+    """
+    Bounded LRU map of discord ID to players.id. Player rows are never
+    deleted or renumbered, so entries never go stale; the bound only keeps
+    memory flat as the set of users who have ever touched a game grows.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.player_ids: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, player_did: str) -> Optional[int]:
+        player_id = self.player_ids.get(player_did)
+        if player_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.player_ids.move_to_end(player_did)
+        return player_id
+
+    def peek(self, player_did: str) -> Optional[int]:
+        """
+        get(), without counting towards the stats or refreshing the entry.
+        """
+        return self.player_ids.get(player_did)
+
+    def put(self, player_did: str, player_id: int) -> None:
+        self.player_ids[player_did] = player_id
+        self.player_ids.move_to_end(player_did)
+        if len(self.player_ids) > self.capacity:
+            self.player_ids.popitem(last=False)
+
+    def stats(self) -> str:
+        return (f"player ids: {len(self.player_ids)}/{self.capacity} cached, "
+                f"{self.hits} hits, {self.misses} misses")
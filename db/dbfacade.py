@@ -1,99 +1,359 @@
-from sqlalchemy.orm import sessionmaker, Query
+from sqlalchemy.orm import sessionmaker, Session, selectinload, joinedload
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.dialects import postgresql
 import sqlalchemy
-from db.model import Base, Platform, State, Mode, Player, Game, Team, Property
-from game_modes import GameMode
-
+from typing import List, Optional
+import hashlib
+from datetime import datetime
+from db.model import Base, Platform, State, Mode, Player, Game, Team, \
+    Property, SequenceState, GuildConfig, player_team_association
+from db.cache import PropertyCache, PlayerIdCache
+from db.migrations import apply_migrations
+from db.property_constants import SEED_VERSION
+from db import lookup
+from game_modes import GameMode, mode_registry
+
+
+# sync session, used for the startup bootstrap and by SyncDatabaseFacade
+session_maker = None
+
+# async sessions, used by every DatabaseFacade coroutine. Each call gets its
+# own session, since an AsyncSession cannot be shared between coroutines.
+async_session_maker = None
+
+# drivers to use on the async engine, keyed by the backend of the connection
+# string we were given
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# dialects whose INSERT supports ON CONFLICT ... RETURNING under sqlalchemy
+UPSERTS = {
+    "postgresql": postgresql.insert,
+}
+
+# Named sets of relationships to load with a Game. Games outlive the session
+# that loaded them, and detached objects cannot lazy load, so each caller asks
+# for exactly what it reads. Mode, platform and state names come from
+# db.lookup instead.
+GAME_LOAD_PROFILES = {
+    # the games row alone: ids, counts and flags. 1 query.
+    "bare": (),
+    # teams, for sizes and the fill check. 2 queries.
+    "teams": (
+        selectinload(Game.teams),
+    ),
+    # teams and their players, for !teams and !start. 2 queries.
+    "roster": (
+        selectinload(Game.teams).joinedload(Team.players),
+    ),
+    # everything str(game) renders, for !showgame. 2 queries.
+    "summary": (
+        joinedload(Game.creator),
+        selectinload(Game.teams).joinedload(Team.players),
+    ),
+}
+
+
+def _seed_rows():
+    """
+    The rows every database needs in the lookup tables, as (model, rows). The
+    modes are whatever mode_registry holds before startup: the defaults, plus
+    any read from a game modes file.
+    """
+    return (
+        (Platform, tuple({"name": name} for name in ("PC", "XBOX", "PS4"))),
+        (State, tuple({"name": name} for name in
+                      ("WAITING", "IN PROGRESS", "FINISHED", "CANCELLED"))),
+        (Mode, tuple(
+            {
+                "name": game_mode.name,
+                "player_num": game_mode.player_num,
+                "teams": " ".join(str(size) for size in game_mode.teams),
+                "random_teams": game_mode.random,
+            }
+            for game_mode in mode_registry
+        )),
+    )
+
+
+def _seed_digest(seed_rows) -> str:
+    """
+    Stored in the SEED_VERSION property once seed_rows are in place; changing
+    the rows changes the digest, which makes startup seed again.
+    """
+    return hashlib.sha1(repr([
+        (model.__tablename__, rows) for model, rows in seed_rows
+    ]).encode()).hexdigest()
+
+
+# how many times a write that lost a race on a game's version is retried
+GAME_WRITE_ATTEMPTS = 5
+
+
+def _retry_stale(write, db_session: Session, *args):
+    """
+    Runs write, which raises StaleDataError when a game it read has since been
+    changed by someone else, until it gets through or runs out of attempts.
+    Each attempt starts from a rolled back session, so it reads afresh.
+    """
+    for attempt in range(1, GAME_WRITE_ATTEMPTS + 1):
+        try:
+            return write(db_session, *args)
+        except StaleDataError:
+            db_session.rollback()
+            print(f"{write.__name__} lost a race on a game, "
+                  f"attempt {attempt}/{GAME_WRITE_ATTEMPTS}")
+    raise StaleDataError(
+        f"{write.__name__} gave up after {GAME_WRITE_ATTEMPTS} attempts"
+    )
+
+
+def _sync_url(connection_string: str):
+    url = make_url(connection_string)
+    # Heroku still hands out postgres://, which sqlalchemy no longer accepts
+    if url.drivername == "postgres":
+        url = url.set(drivername="postgresql")
+    return url
+
+
+def _async_url(connection_string: str):
+    url = _sync_url(connection_string)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+async def _run(impl, *args, **kwargs):
+    """
+    Runs one of the facade's implementation functions on a fresh
+    AsyncSession. The function body is ordinary ORM code; run_sync executes it
+    so that every round trip is awaited on the event loop instead of blocking
+    it.
+    """
+    async with async_session_maker() as db_session:
+        return await db_session.run_sync(impl, *args, **kwargs)
 
 
 class DatabaseFacade:
-    
-    session = None
-
-    def __init__(self, connection_string):
-        engine = create_engine(connection_string, echo=True)
-        maker = sessionmaker(bind=engine)
-        global session
-        session = maker()
+
+    # properties are read on every reaction and almost never written, so all
+    # reads are served from here once startup has loaded the table.
+    property_cache = PropertyCache()
+
+    # discord ID -> players.id for recently active players
+    player_id_cache = PlayerIdCache()
+
+    def __init__(self, connection_string, echo: bool = False):
+        """
+        :param echo: log every SQL statement the engines run
+        """
+        engine = create_engine(_sync_url(connection_string), echo=echo)
+        async_engine = create_async_engine(
+            _async_url(connection_string),
+            echo=echo
+        )
+
+        global session_maker, async_session_maker
+        session_maker = sessionmaker(bind=engine, expire_on_commit=False)
+        async_session_maker = sessionmaker(
+            bind=async_engine,
+            class_=AsyncSession,
+            expire_on_commit=False
+        )
+
         Base.metadata.create_all(engine)
+        apply_migrations(engine)
         self.__init_on_startup()
 
     # All the database stuff will be encapsulated in this class
 
-    # Sponsor of this code is Stackoverflow. Some magic with kwargs parsing
-    def __create_if_absent(self, model, **kwargs):
-        instance = session.query(model).filter_by(**kwargs).first()
-        if instance is None:
-            instance = model(**kwargs)
-            session.add(instance)
-            session.commit()
-
     # Here goes everything we need to pre-fill database on startup if neccessary
     def __init_on_startup(self):
-        # Fill platforms
-        self.__create_if_absent(Platform, name='PC')
-        self.__create_if_absent(Platform, name='XBOX')
-        self.__create_if_absent(Platform, name='PS4')
-
-        # Fill states
-        self.__create_if_absent(State, name='WAITING')
-        self.__create_if_absent(State, name='IN PROGRESS')
-        self.__create_if_absent(State, name='FINISHED')
-        self.__create_if_absent(State, name='CANCELLED')
-
-        # Fill game modes
-        for i in GameMode:
-            self.__create_if_absent(Mode, name=i.full_name)
-
-        session.commit()
-
-    @staticmethod
-    def get_player_by_did(player_did: str) -> Player:
-        query_result: Query = session.query(Player).filter_by(did=player_did)
-
-        if query_result.count() == 0:
-            new_user = Player()
-            new_user.did = player_did
-            session.add(new_user)
-            session.commit()
-            return new_user
-        elif query_result.count() >= 2:
-            print("ERROR: Duplicate User Discord ID in Database: {}".format(
-                player_did,
-            ))
-            return
+        with session_maker() as db_session:
+            DatabaseFacade.property_cache.load(db_session.query(Property))
+
+            seed_rows = _seed_rows()
+            seed_digest = _seed_digest(seed_rows)
+            seed_version = DatabaseFacade.property_cache.get(SEED_VERSION)
+            if seed_version is None or seed_version.value != seed_digest:
+                DatabaseFacade.__seed(db_session, seed_rows, seed_digest)
+
+            lookup.platforms.load(db_session.query(Platform.id, Platform.name))
+            lookup.states.load(db_session.query(State.id, State.name))
+
+            mode_rows = db_session.query(
+                Mode.id,
+                Mode.name,
+                Mode.player_num,
+                Mode.teams,
+                Mode.random_teams
+            ).all()
+            lookup.modes.load((row.id, row.name) for row in mode_rows)
+            # rows added by hand without the mode's columns can't be played
+            mode_registry.load(
+                GameMode(
+                    row.name,
+                    row.player_num,
+                    tuple(int(size) for size in (row.teams or "").split()),
+                    bool(row.random_teams)
+                )
+                for row in mode_rows if row.player_num is not None
+            )
+
+    @staticmethod
+    def __seed(db_session: Session, seed_rows, seed_digest: str):
+        """
+        Inserts whichever seed rows are missing and refreshes the columns of
+        the ones already there, a couple of statements per table, then records
+        seed_digest so the next startup can skip this. All in one transaction.
+        """
+        for model, rows in seed_rows:
+            existing = dict(db_session.execute(
+                sqlalchemy.select(model.name, model.id)
+            ).all())
+            missing = [row for row in rows if row["name"] not in existing]
+            if len(missing) > 0:
+                print(f"Seeding {model.__tablename__}: "
+                      f"{[row['name'] for row in missing]}")
+                db_session.execute(sqlalchemy.insert(model), missing)
+
+            # rows seeded before their table grew more columns than a name
+            present = [
+                dict(row, id=existing[row["name"]]) for row in rows
+                if row["name"] in existing and len(row) > 1
+            ]
+            if len(present) > 0:
+                db_session.bulk_update_mappings(model, present)
+
+        seed_version = DatabaseFacade._set_property(
+            db_session,
+            SEED_VERSION,
+            seed_digest
+        )
+        DatabaseFacade.property_cache.put(SEED_VERSION, seed_version)
+
+    @staticmethod
+    async def get_player_id_by_did(player_did: str) -> int:
+        """
+        Returns the players.id for a discord ID, creating the player if they
+        are new. Players seen recently are answered from memory.
+        """
+        player_id = DatabaseFacade.player_id_cache.get(player_did)
+        if player_id is not None:
+            return player_id
+
+        return await _run(DatabaseFacade._get_player_id_by_did, player_did)
+
+    @staticmethod
+    def _get_player_id_by_did(db_session: Session, player_did: str) -> int:
+        player_id = DatabaseFacade.player_id_cache.peek(player_did)
+        if player_id is not None:
+            return player_id
+
+        player_id = DatabaseFacade._upsert_player(db_session, player_did)
+        db_session.commit()
+
+        DatabaseFacade.player_id_cache.put(player_did, player_id)
+        return player_id
+
+    @staticmethod
+    def _upsert_player(db_session: Session, player_did: str) -> int:
+        """
+        Inserts the player if they are new, and returns their id either way.
+        Does not commit.
+        """
+        upsert = UPSERTS.get(db_session.get_bind().dialect.name)
+        if upsert is not None:
+            # a no-op update on conflict, so that RETURNING also yields the id
+            # of a player who already exists
+            statement = upsert(Player).values(did=player_did)
+            statement = statement.on_conflict_do_update(
+                index_elements=[Player.did],
+                set_={Player.did: statement.excluded.did}
+            ).returning(Player.id)
+            return db_session.execute(statement).scalar_one()
         else:
-            return query_result.first()
+            player = db_session.query(Player).filter_by(did=player_did).first()
+            if player is None:
+                player = Player()
+                player.did = player_did
+                db_session.add(player)
+                db_session.flush()
+            return player.id
+
+    @staticmethod
+    async def get_player_by_did(player_did: str) -> Player:
+        return await _run(DatabaseFacade._get_player_by_did, player_did)
+
+    @staticmethod
+    def _get_player_by_did(db_session: Session, player_did: str) -> Player:
+        return db_session.get(
+            Player,
+            DatabaseFacade._get_player_id_by_did(db_session, player_did)
+        )
+
+    @staticmethod
+    async def add_game(creator_did: str, platform: str, mode: GameMode,
+                       message_did: str, max_size: int=None,
+                       description: str = None) -> Game:
+        """
+        Creates a game, with the creator on team 0, and returns it with its
+        teams loaded.
+        """
+        return await _run(
+            DatabaseFacade._add_game,
+            creator_did,
+            platform,
+            mode,
+            message_did,
+            max_size=max_size,
+            description=description
+        )
 
     @staticmethod
-    def add_game(creator_did: str, platform: str, mode: tuple,
-                 message_did: str, max_size: int=None):
+    def _add_game(db_session: Session, creator_did: str, platform: str,
+                  mode: GameMode, message_did: str,
+                  max_size: int=None, description: str = None) -> Game:
+        """
+        Creates the game, its teams and the creator's place on team 0 as a
+        single transaction.
+        """
 
         print(f"Got mode: {mode}")
 
-        creator: Player = DatabaseFacade.get_player_by_did(creator_did)
+        if mode.player_num == 0:
+            if max_size is not None:
+                team0_size = max_size
+            else:
+                raise ValueError("mode -> max_players is 0, and no max_size was"
+                                 " provided")
+        else:
+            team0_size = mode.player_num
+
+        creator_id = DatabaseFacade.player_id_cache.peek(creator_did)
+        if creator_id is None:
+            creator_id = DatabaseFacade._upsert_player(db_session, creator_did)
 
         new_game = Game()
 
         # state_id = Column(Integer, ForeignKey('states.id'))
         # state = relationship('State', back_populates='games')
-        state = "WAITING"
-        state_query: Query = session.query(State).filter_by(name=state)
-        new_game.state_id = state_query.first().id
+        new_game.state_id = lookup.states.id_of("WAITING")
 
         # creator = relationship('User', back_populates='games')
         # creator_id = Column(Integer, ForeignKey('users.id'))
-        new_game.creator_id = creator.id
+        new_game.creator_id = creator_id
 
         # platform_id = Column(Integer, ForeignKey('platforms.id'))
         # platform = relationship('Platform', back_populates='games')
-        platform_query = session.query(Platform).filter_by(name=platform)
-        new_game.platform_id = platform_query.first().id
+        new_game.platform_id = lookup.platforms.id_of(platform)
 
         # mode_id = Column(Integer, ForeignKey('modes.id'))
         # mode = relationship('Mode', back_populates='games')
-        mode_query = session.query(Mode).filter_by(name=mode[3])
-        new_game.mode_id = mode_query.first().id
+        new_game.mode_id = lookup.modes.id_of(mode.name)
 
         # created_at = Column(DateTime)
         new_game.created_at = sqlalchemy.func.now()
@@ -106,97 +366,204 @@ class DatabaseFacade:
         # game_message_did = Column(String)
         new_game.message_did = message_did
 
+        new_game.description = description
+
         # player_number = Column(Integer)
-        new_game.player_number = 0
+        # the creator, who is put on team 0 below
+        new_game.player_number = 1
 
-        if len(mode[1]) == 0:
+        if len(mode.teams) == 0:
             # teams_available = Column(Boolean)
             new_game.teams_available = False
         else:
             new_game.teams_available = True
 
         # randomize_teams = Column(Boolean)
-        new_game.randomize_teams = mode[2]
-
-        session.add(new_game)
-
-        # this commit has to be here so that game.id is generated by the time
-        # teams need access to it.
-        session.commit()
-
-        team0 = Team()
-        team0.number = 0
-        if mode[0] == 0:
-            if max_size is not None:
-                team0.size = max_size
-            else:
-                raise ValueError("mode -> max_players is 0, and no max_size was"
-                                 " provided")
-        else:
-            team0.size = mode[0]
-
-
-        team0.game_id = new_game.id
-        session.add(team0)
+        new_game.randomize_teams = mode.random
+
+        db_session.add(new_game)
+
+        # flushing gives us game.id for the teams without ending the
+        # transaction.
+        db_session.flush()
+
+        # team 0, then the mode's team sizes adjusted to 1-index
+        team_rows = [{"game_id": new_game.id, "number": 0, "size": team0_size}]
+        for team_number in range(0, len(mode.teams)):
+            team_rows.append({
+                "game_id": new_game.id,
+                "number": team_number + 1,
+                "size": mode.teams[team_number],
+            })
+        db_session.execute(sqlalchemy.insert(Team), team_rows)
+
+        # team 0's id isn't known here, so the creator's row selects it
+        db_session.execute(
+            sqlalchemy.insert(player_team_association).from_select(
+                ["player_id", "team_id"],
+                sqlalchemy.select(
+                    sqlalchemy.literal(creator_id),
+                    Team.id
+                ).where(Team.game_id == new_game.id, Team.number == 0)
+            )
+        )
 
-        # iterates over team sizes from the mode, and adjusts to 1-index
-        for team_number in range(0, len(mode[1])):
-            print(f"creating team with number: {team_number}")
-            team = Team()
-            team.number = team_number + 1
-            team.size = mode[1][team_number]
-            team.game_id = new_game.id
+        db_session.commit()
+        DatabaseFacade.player_id_cache.put(creator_did, creator_id)
 
-            session.add(team)
+        return DatabaseFacade._get_game_by_id(
+            db_session,
+            new_game.id,
+            "teams"
+        )
 
-        session.commit()
+    @staticmethod
+    async def get_game_by_id(game_id: int, profile: str = "summary") -> Game:
+        return await _run(DatabaseFacade._get_game_by_id, game_id, profile)
 
-        DatabaseFacade.add_player_to_game(new_game.id, creator)
+    @staticmethod
+    def _get_game_by_id(db_session: Session, game_id: int,
+                        profile: str = "summary") -> Game:
+        return DatabaseFacade._query_game(db_session, profile).filter_by(
+            id=game_id
+        ).populate_existing().first()
 
-        return new_game
+    @staticmethod
+    async def get_game_by_message_did(message_did: str,
+                                      profile: str = "summary") -> Game:
+        return await _run(
+            DatabaseFacade._get_game_by_message_did,
+            message_did,
+            profile
+        )
 
     @staticmethod
-    def get_game_by_id(game_id: int) -> Game:
-        return session.query(Game).filter_by(id=game_id).first()
+    def _get_game_by_message_did(db_session: Session, message_did: str,
+                                 profile: str = "summary") -> Game:
+        return DatabaseFacade._query_game(db_session, profile).filter_by(
+            message_did=message_did
+        ).first()
 
     @staticmethod
-    def get_game_by_message_did(message_did: str) -> Game:
-        return session.query(Game).filter_by(message_did=message_did).first()
+    async def get_game_by_game_message_did(game_message_did: str,
+                                           profile: str = "summary") -> Game:
+        return await _run(
+            DatabaseFacade._get_game_by_game_message_did,
+            game_message_did,
+            profile
+        )
 
     @staticmethod
-    def get_game_by_game_message_did(game_message_did: str) -> Game:
-        return session.query(Game).filter_by(
+    def _get_game_by_game_message_did(db_session: Session,
+                                      game_message_did: str,
+                                      profile: str = "summary") -> Game:
+        return DatabaseFacade._query_game(db_session, profile).filter_by(
             game_message_did=game_message_did
         ).first()
 
     @staticmethod
-    def get_game_by_channel_did(channel_did: str) -> Game:
+    async def get_game_by_channel_did(channel_did: str,
+                                      profile: str = "summary") -> Game:
+        return await _run(
+            DatabaseFacade._get_game_by_channel_did,
+            channel_did,
+            profile
+        )
+
+    @staticmethod
+    def _get_game_by_channel_did(db_session: Session, channel_did: str,
+                                 profile: str = "summary") -> Game:
         print(f"Get on channel with did {channel_did}")
-        return session.query(Game).filter_by(
+        return DatabaseFacade._query_game(db_session, profile).filter_by(
             channel_id=channel_did
         ).first()
 
     @staticmethod
-    def update_game(game_id: int,
-                    message_did: str = None,
-                    game_message_did: str = None,
-                    channel_did: str = None) -> None:
-        game: Game = DatabaseFacade.get_game_by_id(game_id)
+    def _query_game(db_session: Session, profile: str):
+        """
+        A query for games, loading the relationships named by the profile; see
+        GAME_LOAD_PROFILES.
+        """
+        return db_session.query(Game).options(*GAME_LOAD_PROFILES[profile])
+
+    @staticmethod
+    async def get_game_message_dids() -> list:
+        """
+        Returns (game id, message_did, game_message_did) for every game.
+        """
+        return await _run(DatabaseFacade._get_game_message_dids)
+
+    @staticmethod
+    def _get_game_message_dids(db_session: Session) -> list:
+        return db_session.query(
+            Game.id,
+            Game.message_did,
+            Game.game_message_did
+        ).all()
+
+    @staticmethod
+    async def update_game(game_id: int,
+                          message_did: str = None,
+                          game_message_did: str = None,
+                          channel_did: str = None,
+                          message_channel_did: str = None,
+                          role_did: str = None) -> None:
+        await _run(
+            DatabaseFacade._update_game,
+            game_id,
+            message_did=message_did,
+            game_message_did=game_message_did,
+            channel_did=channel_did,
+            message_channel_did=message_channel_did,
+            role_did=role_did
+        )
+
+    @staticmethod
+    def _update_game(db_session: Session,
+                     game_id: int,
+                     message_did: str = None,
+                     game_message_did: str = None,
+                     channel_did: str = None,
+                     message_channel_did: str = None,
+                     role_did: str = None) -> None:
+        values = {}
 
         if message_did is not None:
-            game.message_did = message_did
+            values["message_did"] = message_did
 
         if game_message_did is not None:
-            game.game_message_did = game_message_did
+            values["game_message_did"] = game_message_did
 
         if channel_did is not None:
-            game.channel_id = channel_did
+            values["channel_id"] = channel_did
+
+        if message_channel_did is not None:
+            values["message_channel_id"] = message_channel_did
+
+        if role_did is not None:
+            values["role_did"] = role_did
+
+        # a blind write, so it can't conflict; it only has to bump the version
+        db_session.execute(
+            sqlalchemy.update(Game)
+            .where(Game.id == game_id)
+            .values(version=Game.version + 1, **values)
+        )
+        db_session.commit()
+
+    @staticmethod
+    async def get_property(property_name: str) -> Property:
+        cached = DatabaseFacade.property_cache.get(property_name)
+        if DatabaseFacade.property_cache.contains(property_name):
+            return cached
 
-        session.commit()
+        prop = await _run(DatabaseFacade._get_property, property_name)
+        DatabaseFacade.property_cache.put(property_name, prop)
+        return prop
 
     @staticmethod
-    def get_property(property_name: str) -> Property:
-        property_query = session.query(Property).filter_by(
+    def _get_property(db_session: Session, property_name: str) -> Property:
+        property_query = db_session.query(Property).filter_by(
             name=property_name
         )
         property_row = property_query.first()
@@ -207,95 +574,416 @@ class DatabaseFacade:
             return None
 
     @staticmethod
-    def set_property(prop_name: str, prop_value: str):
+    async def set_property(prop_name: str, prop_value: str):
+        prop = await _run(DatabaseFacade._set_property, prop_name, prop_value)
+        DatabaseFacade.property_cache.put(prop_name, prop)
+
+    @staticmethod
+    def _set_property(db_session: Session, prop_name: str,
+                      prop_value: str) -> Property:
         print(f"prop({prop_name}, {prop_value})")
-        prop: str = DatabaseFacade.get_property(prop_name)
+        prop: Property = DatabaseFacade._get_property(db_session, prop_name)
         print(f"looked up {prop_name} and got: {str(prop)}")
         if prop is not None:
             prop.value = prop_value
-            session.commit()
+            db_session.commit()
         else:
             prop = Property()
-            session.add(prop)
+            db_session.add(prop)
             prop.name = prop_name
             prop.value = prop_value
 
-            session.commit()
-            return
+            db_session.commit()
+
+        return prop
 
     @staticmethod
-    def add_player_to_team(
+    async def add_player_to_team(
             game_id: int,
             team_number: int,
-            player: Player
+            player_id: int
     ) -> bool:
+        return await _run(
+            DatabaseFacade._add_player_to_team,
+            game_id,
+            team_number,
+            player_id
+        )
 
-        game: Game = DatabaseFacade.get_game_by_id(game_id)
-        return DatabaseFacade._add_player_to_team(game, team_number, player)
-
-        # session.commit()
+    @staticmethod
+    def _team_of_player(db_session: Session, game_id: int,
+                        player_id: int) -> Optional[int]:
+        """
+        Returns the id of the team the player is on in this game, or None if
+        they are not in it.
+        """
+        return db_session.execute(
+            sqlalchemy.select(player_team_association.c.team_id)
+            .join(Team, Team.id == player_team_association.c.team_id)
+            .where(
+                Team.game_id == game_id,
+                player_team_association.c.player_id == player_id
+            )
+        ).scalar()
 
     @staticmethod
     def _add_player_to_team(
-            game: Game,
+            db_session: Session,
+            game_id: int,
             team_number: int,
-            player: Player
+            player_id: int
     ) -> bool:
-
-        if team_number > len(game.teams):
-            return False
-        elif team_number < 0:
+        """
+        Moves the player onto the numbered team, adding them to the game if
+        they weren't in it. Works directly on player_team_association, so the
+        cost doesn't depend on how many teams or players the game has.
+
+        Returns False if the move was refused, which includes the game
+        changing under every retry.
+        """
+        try:
+            return _retry_stale(
+                DatabaseFacade._try_add_player_to_team,
+                db_session,
+                game_id,
+                team_number,
+                player_id
+            )
+        except StaleDataError as e:
+            print(f"ERROR: not adding player {player_id} to game {game_id}: "
+                  f"{e}")
             return False
 
-        print(f"Adding player {player.id} to game: {game.id}, "
+    @staticmethod
+    def _try_add_player_to_team(
+            db_session: Session,
+            game_id: int,
+            team_number: int,
+            player_id: int
+    ) -> bool:
+        print(f"Adding player {player_id} to game: {game_id}, "
               f"team: {team_number}")
-        for team in game.teams:
-            if player in team.players:
-                team.players.remove(player)
-                session.commit()
 
-        team: Team = game.teams[team_number]
-        if player not in team.players:
+        # the target team, how many players it holds already, and how many
+        # the game holds
+        target = db_session.execute(
+            sqlalchemy.select(
+                Team.id,
+                Team.size,
+                Game.player_number,
+                Game.version,
+                sqlalchemy.func.count(player_team_association.c.player_id)
+            )
+            .join(Game, Game.id == Team.game_id)
+            .outerjoin(
+                player_team_association,
+                player_team_association.c.team_id == Team.id
+            )
+            .where(Team.game_id == game_id, Team.number == team_number)
+            .group_by(Team.id, Team.size, Game.player_number, Game.version)
+        ).first()
+
+        if target is None:
+            return False
+        team_id, team_size, game_player_count, version, team_player_count \
+            = target
 
-            # team is full
-            if len(team.players) > team.size:
+        current_team_id = DatabaseFacade._team_of_player(
+            db_session,
+            game_id,
+            player_id
+        )
+        if current_team_id == team_id:
+            return True
+
+        if current_team_id is None:
+            # players enter a game through team 0, whose size is the size of
+            # the whole game
+            if team_number != 0 or game_player_count >= team_size:
                 return False
-            team.players.append(player)
-        game.player_number += 1
-        session.commit()
+        # team is full. Team 0 can't be, for a player already in the game.
+        elif team_number != 0 and team_player_count >= team_size:
+            return False
+
+        # The checks above hold only if nobody changed the game since we read
+        # it; the version tells. Joining also counts the player in.
+        values = {"version": Game.version + 1}
+        if current_team_id is None:
+            values["player_number"] = Game.player_number + 1
+        claimed = db_session.execute(
+            sqlalchemy.update(Game)
+            .where(Game.id == game_id, Game.version == version)
+            .values(**values)
+        ).rowcount
+        if claimed == 0:
+            raise StaleDataError(f"game {game_id} changed since version "
+                                 f"{version}")
+
+        if current_team_id is not None:
+            db_session.execute(
+                sqlalchemy.delete(player_team_association).where(
+                    player_team_association.c.player_id == player_id,
+                    player_team_association.c.team_id == current_team_id
+                )
+            )
+
+        db_session.execute(
+            sqlalchemy.insert(player_team_association).values(
+                player_id=player_id,
+                team_id=team_id
+            )
+        )
+        db_session.commit()
         return True
 
     @staticmethod
-    def add_player_to_game(game_id: int, player: Player):
-        print(f"Adding player: {player.id} to game: {game_id}")
-        game: Game = DatabaseFacade.get_game_by_id(game_id)
-        # put them on team 0
-        DatabaseFacade._add_player_to_team(game, 0, player)
+    async def add_player_to_game(game_id: int,
+                                 player_id: int) -> Optional[Game]:
+        """
+        Puts the player on team 0 of the game if they aren't in it already,
+        and returns the game, with its teams, as it stands afterwards. Returns
+        None if the player could not be added, e.g. because the game filled
+        up first.
+        """
+        return await _run(
+            DatabaseFacade._add_player_to_game,
+            game_id,
+            player_id
+        )
 
-        session.commit()
+    @staticmethod
+    def _add_player_to_game(db_session: Session, game_id: int,
+                            player_id: int) -> Optional[Game]:
+        print(f"Adding player: {player_id} to game: {game_id}")
+        if DatabaseFacade._team_of_player(db_session, game_id, player_id) \
+                is None:
+            # put them on team 0
+            if not DatabaseFacade._add_player_to_team(
+                    db_session,
+                    game_id,
+                    0,
+                    player_id
+            ):
+                return None
+
+        # callers only look at the fill count and team sizes
+        return DatabaseFacade._get_game_by_id(db_session, game_id, "teams")
 
     @staticmethod
-    def remove_player_from_game(game_id: int, player: Player) -> bool:
+    async def remove_player_from_game(game_id: int, player_id: int) -> bool:
+        return await _run(
+            DatabaseFacade._remove_player_from_game,
+            game_id,
+            player_id
+        )
 
-        game: Game = DatabaseFacade.get_game_by_id(game_id)
-        for team in game.teams:
-            if player in team.players:
-                team.players.remove(player)
-                game.player_number -= 1
-                session.commit()
-                return True
-            else:
-                return False
+    @staticmethod
+    def _remove_player_from_game(db_session: Session, game_id: int,
+                                 player_id: int) -> bool:
+        game_team_ids = sqlalchemy.select(Team.id).where(
+            Team.game_id == game_id
+        )
+        removed = db_session.execute(
+            sqlalchemy.delete(player_team_association).where(
+                player_team_association.c.player_id == player_id,
+                player_team_association.c.team_id.in_(game_team_ids)
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+
+        if removed == 0:
+            return False
+
+        # the delete's row count is what we go by, so this needs no version
+        # check; the bump is for writers that read the game before it
+        db_session.execute(
+            sqlalchemy.update(Game)
+            .where(Game.id == game_id)
+            .values(
+                player_number=Game.player_number - 1,
+                version=Game.version + 1
+            )
+        )
+        db_session.commit()
+        return True
 
     @staticmethod
-    def delete_game_by_id(game_id: int):
-        session.query(Game).filter_by(id=game_id).delete()
-        session.commit()
+    async def delete_game_by_id(game_id: int):
+        await _run(DatabaseFacade._delete_game_by_id, game_id)
 
     @staticmethod
-    def start_game(game_id: int):
-        game: Game = session.query(Game).filter_by(id=game_id)
-        game.started_at = sqlalchemy.func.now()
-        session.commit()
+    def _delete_game_by_id(db_session: Session, game_id: int):
+        db_session.query(Game).filter_by(id=game_id).delete()
+        db_session.commit()
 
+    @staticmethod
+    async def start_game(game_id: int):
+        await _run(DatabaseFacade._start_game, game_id)
 
+    @staticmethod
+    def _start_game(db_session: Session, game_id: int):
+        db_session.execute(
+            sqlalchemy.update(Game)
+            .where(Game.id == game_id)
+            .values(
+                started_at=sqlalchemy.func.now(),
+                version=Game.version + 1
+            )
+        )
+        db_session.commit()
+
+    @staticmethod
+    async def save_sequence_state(user_did: str, sequence_type: str,
+                                  state: str, expires_at: datetime) -> None:
+        await _run(
+            DatabaseFacade._save_sequence_state,
+            user_did,
+            sequence_type,
+            state,
+            expires_at
+        )
+
+    @staticmethod
+    def _save_sequence_state(db_session: Session, user_did: str,
+                             sequence_type: str, state: str,
+                             expires_at: datetime) -> None:
+        sequence_state = SequenceState()
+        sequence_state.user_did = user_did
+        sequence_state.sequence_type = sequence_type
+        sequence_state.state = state
+        sequence_state.expires_at = expires_at
+        db_session.merge(sequence_state)
+        db_session.commit()
+
+    @staticmethod
+    async def get_sequence_state(user_did: str) -> Optional[SequenceState]:
+        """
+        Returns the user's saved sequence, unless it has expired.
+        """
+        return await _run(DatabaseFacade._get_sequence_state, user_did)
+
+    @staticmethod
+    def _get_sequence_state(db_session: Session,
+                            user_did: str) -> Optional[SequenceState]:
+        return db_session.query(SequenceState).filter(
+            SequenceState.user_did == user_did,
+            SequenceState.expires_at > datetime.utcnow()
+        ).first()
+
+    @staticmethod
+    async def delete_sequence_state(user_did: str) -> None:
+        await _run(DatabaseFacade._delete_sequence_state, user_did)
+
+    @staticmethod
+    def _delete_sequence_state(db_session: Session, user_did: str) -> None:
+        db_session.query(SequenceState).filter_by(user_did=user_did).delete()
+        db_session.commit()
+
+    @staticmethod
+    async def delete_expired_sequence_states() -> None:
+        await _run(DatabaseFacade._delete_expired_sequence_states)
+
+    @staticmethod
+    def _delete_expired_sequence_states(db_session: Session) -> None:
+        db_session.query(SequenceState).filter(
+            SequenceState.expires_at <= datetime.utcnow()
+        ).delete()
+        db_session.commit()
+
+    @staticmethod
+    async def get_guild_configs() -> List[GuildConfig]:
+        return await _run(DatabaseFacade._get_guild_configs)
+
+    @staticmethod
+    def _get_guild_configs(db_session: Session) -> List[GuildConfig]:
+        return db_session.query(GuildConfig).all()
+
+    @staticmethod
+    async def save_guild_config(guild_did: str, create_channel_did: str,
+                                join_channel_did: str,
+                                game_category_did: str) -> GuildConfig:
+        return await _run(
+            DatabaseFacade._save_guild_config,
+            guild_did,
+            create_channel_did,
+            join_channel_did,
+            game_category_did
+        )
+
+    @staticmethod
+    def _save_guild_config(db_session: Session, guild_did: str,
+                           create_channel_did: str, join_channel_did: str,
+                           game_category_did: str) -> GuildConfig:
+        guild_config = GuildConfig()
+        guild_config.guild_did = guild_did
+        guild_config.create_channel_did = create_channel_did
+        guild_config.join_channel_did = join_channel_did
+        guild_config.game_category_did = game_category_did
+        guild_config = db_session.merge(guild_config)
+        db_session.commit()
+        return guild_config
+
+    @staticmethod
+    async def set_spare_channel_dids(guild_did: str,
+                                     spare_channel_dids: str) -> None:
+        await _run(
+            DatabaseFacade._set_spare_channel_dids,
+            guild_did,
+            spare_channel_dids
+        )
+
+    @staticmethod
+    def _set_spare_channel_dids(db_session: Session, guild_did: str,
+                                spare_channel_dids: str) -> None:
+        db_session.execute(
+            sqlalchemy.update(GuildConfig)
+            .where(GuildConfig.guild_did == guild_did)
+            .values(spare_channel_dids=spare_channel_dids)
+        )
+        db_session.commit()
+
+
+def _compat(impl):
+    """
+    Wraps one of DatabaseFacade's implementation functions so it can be called
+    synchronously, on its own blocking session.
+    """
+    def call(*args, **kwargs):
+        with session_maker() as db_session:
+            return impl(db_session, *args, **kwargs)
+    return staticmethod(call)
+
+
+class SyncDatabaseFacade:
+    """
+    Blocking mirror of DatabaseFacade, for scripts and the python shell. Never
+    use this from inside the bot; it stalls the event loop for every round
+    trip. DatabaseFacade must have been constructed first.
+    """
+
+    get_player_id_by_did = _compat(DatabaseFacade._get_player_id_by_did)
+    get_player_by_did = _compat(DatabaseFacade._get_player_by_did)
+    add_game = _compat(DatabaseFacade._add_game)
+    get_game_by_id = _compat(DatabaseFacade._get_game_by_id)
+    get_game_by_message_did = _compat(DatabaseFacade._get_game_by_message_did)
+    get_game_by_game_message_did = _compat(
+        DatabaseFacade._get_game_by_game_message_did
+    )
+    get_game_by_channel_did = _compat(DatabaseFacade._get_game_by_channel_did)
+    get_game_message_dids = _compat(DatabaseFacade._get_game_message_dids)
+    update_game = _compat(DatabaseFacade._update_game)
+    get_property = _compat(DatabaseFacade._get_property)
+    set_property = _compat(DatabaseFacade._set_property)
+    add_player_to_team = _compat(DatabaseFacade._add_player_to_team)
+    add_player_to_game = _compat(DatabaseFacade._add_player_to_game)
+    remove_player_from_game = _compat(DatabaseFacade._remove_player_from_game)
+    delete_game_by_id = _compat(DatabaseFacade._delete_game_by_id)
+    start_game = _compat(DatabaseFacade._start_game)
+    save_sequence_state = _compat(DatabaseFacade._save_sequence_state)
+    get_sequence_state = _compat(DatabaseFacade._get_sequence_state)
+    delete_sequence_state = _compat(DatabaseFacade._delete_sequence_state)
+    delete_expired_sequence_states = _compat(
+        DatabaseFacade._delete_expired_sequence_states
+    )
+    get_guild_configs = _compat(DatabaseFacade._get_guild_configs)
+    save_guild_config = _compat(DatabaseFacade._save_guild_config)
+    set_spare_channel_dids = _compat(DatabaseFacade._set_spare_channel_dids)
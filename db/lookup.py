@@ -0,0 +1,34 @@
+"""
+In-memory copies of the lookup tables (platforms, states and modes). They are
+seeded at startup and never change afterwards, so the facade loads each of
+them once and everything else resolves names and ids from here.
+"""
+from types import MappingProxyType
+from typing import Iterable, Mapping, Tuple
+
+
+class LookupTable:
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self.ids: Mapping[str, int] = MappingProxyType({})
+        self.names: Mapping[int, str] = MappingProxyType({})
+
+    def load(self, rows: Iterable[Tuple[int, str]]) -> None:
+        rows = list(rows)
+        self.ids = MappingProxyType({name: row_id for row_id, name in rows})
+        self.names = MappingProxyType({row_id: name for row_id, name in rows})
+
+    def id_of(self, name: str) -> int:
+        try:
+            return self.ids[name]
+        except KeyError:
+            raise ValueError(f"no row named {name} in {self.table_name}")
+
+    def name_of(self, row_id: int) -> str:
+        return self.names[row_id]
+
+
+platforms = LookupTable("platforms")
+states = LookupTable("states")
+modes = LookupTable("modes")
@@ -0,0 +1,129 @@
+"""
+Brings databases created by older versions of the bot up to date with
+db/model.py. create_all only creates missing tables, so anything added to an
+existing table has to be applied here. Every step is idempotent and runs on
+each startup, after create_all; on a fresh database they are all no-ops.
+"""
+from sqlalchemy import func, select, update, delete, insert, inspect
+from sqlalchemy.engine import Connection, Engine
+from db.model import Base, Player, Game, Team, player_team_association
+
+
+def apply_migrations(engine: Engine) -> None:
+    with engine.begin() as connection:
+        _add_missing_columns(connection)
+        _merge_duplicate_players(connection)
+        _create_missing_indexes(connection)
+
+
+def _add_missing_columns(connection: Connection) -> None:
+    """
+    Adds any column the model declares that an existing table lacks. New
+    columns must be nullable, or have a server_default, for this to work on
+    tables that already hold rows.
+    """
+    inspector = inspect(connection)
+    ddl_compiler = connection.dialect.ddl_compiler(connection.dialect, None)
+    for table in Base.metadata.sorted_tables:
+        existing = {
+            column["name"] for column in inspector.get_columns(table.name)
+        }
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            print(f"Adding column {table.name}.{column.name}")
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN "
+                + ddl_compiler.get_column_specification(column)
+            )
+
+
+def _merge_duplicate_players(connection: Connection) -> None:
+    """
+    Players used to be created without any uniqueness check on did, so older
+    databases can hold several rows for one discord user. Folds each set of
+    duplicates into its lowest id, so the unique index on did can be built.
+
+    Duplicates that were in the same game leave the merged player in it more
+    than once; they keep one place per game, on the highest numbered team
+    they were on, and those games' player counts are recounted.
+    """
+    duplicates = connection.execute(
+        select(Player.did, func.min(Player.id))
+        .group_by(Player.did)
+        .having(func.count(Player.id) > 1)
+    ).all()
+
+    for did, keep_id in duplicates:
+        print(f"Merging duplicate players with did {did} into {keep_id}")
+        duplicate_ids = select(Player.id).where(
+            Player.did == did,
+            Player.id != keep_id
+        )
+
+        connection.execute(
+            update(Game)
+            .where(Game.creator_id.in_(duplicate_ids))
+            .values(creator_id=keep_id)
+        )
+        connection.execute(
+            update(player_team_association)
+            .where(player_team_association.c.player_id.in_(duplicate_ids))
+            .values(player_id=keep_id)
+        )
+        connection.execute(
+            delete(Player).where(Player.did == did, Player.id != keep_id)
+        )
+        _dedupe_memberships(connection, keep_id)
+
+
+def _dedupe_memberships(connection: Connection, player_id: int) -> None:
+    # game -> the player's team rows in it, highest numbered team first
+    memberships = {}
+    for game_id, team_id in connection.execute(
+        select(Team.game_id, Team.id)
+        .join(
+            player_team_association,
+            player_team_association.c.team_id == Team.id
+        )
+        .where(player_team_association.c.player_id == player_id)
+        .order_by(Team.number.desc())
+    ):
+        memberships.setdefault(game_id, []).append(team_id)
+
+    for game_id, team_ids in memberships.items():
+        if len(team_ids) == 1:
+            continue
+
+        # The repeated rows can be identical, and the table has no key to
+        # tell them apart by, so they all go and one is put back.
+        connection.execute(
+            delete(player_team_association).where(
+                player_team_association.c.player_id == player_id,
+                player_team_association.c.team_id.in_(team_ids)
+            )
+        )
+        connection.execute(
+            insert(player_team_association).values(
+                player_id=player_id,
+                team_id=team_ids[0]
+            )
+        )
+        connection.execute(
+            update(Game)
+            .where(Game.id == game_id)
+            .values(
+                player_number=select(func.count())
+                .select_from(player_team_association)
+                .join(Team, Team.id == player_team_association.c.team_id)
+                .where(Team.game_id == game_id)
+                .scalar_subquery()
+            )
+        )
+
+
+def _create_missing_indexes(connection: Connection) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
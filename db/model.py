@@ -1,6 +1,7 @@
 from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Table
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
+from db import lookup
 
 Base = declarative_base()
 
@@ -16,7 +17,7 @@ player_team_association = Table(
 class Player(Base):
     __tablename__ = 'players'
     id = Column(Integer, primary_key=True)
-    did = Column(String)
+    did = Column(String, index=True, unique=True)
     teams = relationship("Team", secondary=player_team_association, back_populates="players")
     games = relationship("Game")
     # Here be something else we want to store about the player
@@ -26,7 +27,9 @@ class Player(Base):
 class Game(Base):
     __tablename__ = 'games'
     id = Column(Integer, primary_key=True)
-    channel_id = Column(String)
+    channel_id = Column(String, index=True)
+    # the role that can see the game's channel, for games that have one
+    role_did = Column(String)
     state_id = Column(Integer, ForeignKey('states.id'))
     state = relationship('State', back_populates='games', cascade="all")
     creator_id = Column(Integer, ForeignKey('players.id'))
@@ -38,12 +41,20 @@ class Game(Base):
     created_at = Column(DateTime)
     started_at = Column(DateTime)
     finished_at = Column(DateTime)
-    message_did = Column(String)
-    game_message_did = Column(String)
+    message_did = Column(String, index=True)
+    message_channel_id = Column(String)
+    game_message_did = Column(String, index=True)
     player_number = Column(Integer)
     teams_available = Column(Boolean)
     randomize_teams = Column(Boolean)
-    teams = relationship('Team')
+    # what the creator wrote about the game, shown in its summaries
+    description = Column(String)
+    # bumped by every write to the row, so that a writer can tell whether the
+    # game changed since it read it
+    version = Column(Integer, nullable=False, server_default="0")
+    teams = relationship('Team', order_by='Team.number')
+
+    __mapper_args__ = {"version_id_col": version}
 
     def __str__(self):
         teams_list_str = [str(team) for team in self.teams]
@@ -51,8 +62,8 @@ class Game(Base):
         team_str = "\n".join(teams_list_str)
 
         return f"creator_did: {self.creator.did} \
-                \nmode: {self.mode.name} \
-                \nplatform: {self.platform.name} \
+                \nmode: {lookup.modes.name_of(self.mode_id)} \
+                \nplatform: {lookup.platforms.name_of(self.platform_id)} \
                 \ncreated_at: {self.created_at} \
                 \nteams:\n{team_str}\
                 \nmessage_did: {self.message_did}"
@@ -82,6 +93,10 @@ class Mode(Base):
     __tablename__ = 'modes'
     id = Column(Integer, primary_key=True)
     name = Column(String)
+    player_num = Column(Integer)
+    # space separated team sizes, e.g. "2 2 2"
+    teams = Column(String)
+    random_teams = Column(Boolean)
     games = relationship('Game')
 
 
@@ -93,7 +108,12 @@ class Team(Base):
     size = Column(Integer)
     game_id = Column(Integer, ForeignKey('games.id', ondelete="cascade"))
     game = relationship('Game', back_populates='teams')
-    players = relationship("Player", secondary=player_team_association, back_populates="teams")
+    players = relationship(
+        "Player",
+        secondary=player_team_association,
+        back_populates="teams",
+        collection_class=set
+    )
 
     def __str__(self):
         return (f"Team{{id={self.id}, number={self.number}, size={self.size},"
@@ -117,4 +137,24 @@ class Property(Base):
     name = Column(String, unique=True)
     value = Column(String)
 
+# In-flight message sequences, so that they survive a restart. state is a
+# compact JSON dump of whatever the sequence needs to pick up where it was.
+class SequenceState(Base):
+    __tablename__ = 'sequence_states'
+    user_did = Column(String, primary_key=True)
+    sequence_type = Column(String)
+    state = Column(String)
+    expires_at = Column(DateTime, index=True)
+
+# Which channels the bot uses in each guild, by discord ID. Any of them may be
+# unset until an admin runs !setup in the guild.
+class GuildConfig(Base):
+    __tablename__ = 'guild_configs'
+    guild_did = Column(String, primary_key=True)
+    create_channel_did = Column(String)
+    join_channel_did = Column(String)
+    game_category_did = Column(String)
+    # space separated IDs of the hidden channels kept ready for new games
+    spare_channel_dids = Column(String)
+
 # TODO: Add the actual result reporting (don't know how are we going to do it yet
@@ -9,3 +9,8 @@ JOIN_GAME_CHANNEL = "JOIN_GAME_CHANNEL"
 
 GAME_CATEGORY_PROPERTY_NAME = "GAMES_CATEGORY_NAME"
 
+# space separated IDs of every !scrims message the bot has posted
+CREATE_GAME_MESSAGES = "CREATE_GAME_MESSAGES"
+
+# digest of the lookup table rows the database was last seeded with
+SEED_VERSION = "SEED_VERSION"
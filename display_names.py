@@ -0,0 +1,73 @@
+import asyncio
+import time
+from collections import OrderedDict
+from discord import Client, Guild, HTTPException, NotFound
+from typing import Dict, Iterable
+
+
+class DisplayNameResolver:
+    """
+    Resolves discord user IDs to display names for rendering rosters. Names
+    come from the guild's member cache where possible; the rest are fetched
+    concurrently, a bounded number at a time, and remembered for ttl seconds,
+    so a roster costs at most one round of REST calls and usually none. At
+    most capacity names are remembered.
+    """
+
+    def __init__(self, client: Client, ttl: float = 600,
+                 max_concurrent_fetches: int = 5, capacity: int = 1000):
+        self.client = client
+        self.ttl = ttl
+        self.capacity = capacity
+        self.fetch_limit = asyncio.Semaphore(max_concurrent_fetches)
+
+        # user id -> (display name, time it expires at). Every entry lives
+        # for ttl, so they are in order of expiry, soonest first.
+        self.names: OrderedDict = OrderedDict()
+
+    async def resolve(self, guild: Guild,
+                      user_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Returns a display name for each of the user IDs. Users that can't be
+        fetched are named by their ID.
+        """
+        resolved: Dict[int, str] = {}
+        missing = []
+        now = time.monotonic()
+
+        for user_id in set(user_ids):
+            member = guild.get_member(user_id) if guild is not None else None
+            cached = self.names.get(user_id)
+            if member is not None:
+                resolved[user_id] = member.display_name
+            elif cached is not None and cached[1] > now:
+                resolved[user_id] = cached[0]
+            else:
+                missing.append(user_id)
+
+        fetched = await asyncio.gather(
+            *[self._fetch_name(user_id) for user_id in missing]
+        )
+        resolved.update(zip(missing, fetched))
+        return resolved
+
+    async def _fetch_name(self, user_id: int) -> str:
+        async with self.fetch_limit:
+            try:
+                user = await self.client.fetch_user(user_id)
+            except (NotFound, HTTPException) as e:
+                print(f"ERROR: could not fetch user {user_id}: {type(e)}")
+                return str(user_id)
+
+        now = time.monotonic()
+        self.names[user_id] = (user.display_name, now + self.ttl)
+        self.names.move_to_end(user_id)
+
+        # drop what has expired, and the soonest to expire past capacity
+        while len(self.names) > 0:
+            _, expires_at = next(iter(self.names.values()))
+            if expires_at > now and len(self.names) <= self.capacity:
+                break
+            self.names.popitem(last=False)
+
+        return user.display_name
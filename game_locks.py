@@ -0,0 +1,44 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+
+class GameLocks:
+    """
+    One asyncio.Lock per game, so that changes to a game's players run one at
+    a time while other games carry on. Reaction and command handlers each
+    check a game and then change it over several awaits; without the lock,
+    two joins can both see the last free slot and both take it.
+
+    A game's lock only exists while someone holds or waits for it, so locks
+    of finished and deleted games don't pile up.
+    """
+
+    def __init__(self):
+        # game id -> [lock, number of coroutines holding or waiting for it]
+        self.locks: Dict[int, List] = {}
+        self.waits = 0
+
+    @asynccontextmanager
+    async def hold(self, game_id: int):
+        entry = self.locks.get(game_id)
+        if entry is None:
+            entry = self.locks[game_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+
+        try:
+            if entry[0].locked():
+                self.waits += 1
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[game_id]
+
+    def stats(self) -> str:
+        return f"game locks: {len(self.locks)} in use, {self.waits} waits"
+
+
+# shared by every handler that changes a game's players or state
+game_locks = GameLocks()
@@ -1,37 +1,129 @@
-from enum import Enum
-
-
-# The Enum with all game modes. Using array of teams instead of number, since there may be asymmetrical game modes.
-class GameMode(Enum):
-    FFA = (0, [], True, "FFA")
-    DUEL = (2, [], False, "1v1")
-    FIXED2v2 = (4, [2, 2], False, "2v2 Fixed Teams")
-    FIXED3v3 = (6, [3, 3], False, "3v3 Fixed Teams")
-    FIXED4v4 = (8, [4, 4], False, "4v4 Fixed Teams")
-    FIXED5v5 = (10, [5, 5], False, "5v5 Fixed Teams")
-    FIXED2v2v2 = (6, [2, 2, 2], False, "2v2v2 Fixed Teams")
-    FIXED3v3v3 = (9, [3, 3, 3], False, "3v3v3 Fixed Teams")
-    FIXED4v4v4 = (12, [4, 4, 4], False, "4v4v4 Fixed Teams")
-    FIXED2v2v2v2 = (8, [2, 2, 2, 2], False, "2v2v2v2 Fixed Teams")
-    FIXED3v3v3v3 = (12, [3, 3, 3, 3], False, "3v3v3v3 Fixed Teams")
-    FIXED2v2v2v2v2 = (10, [2, 2, 2, 2, 2], False, "2v2v2v2v2 Fixed Teams")
-    FIXED2v2v2v2v2v2 = (12, [2, 2, 2, 2, 2, 2], False, "2v2v2v2v2v2 Fixed Teams")
-    RANDOM1v1 = (2, [1, 1], True, "1v1 Random Teams")
-    RANDOM2v2 = (4, [2, 2], True, "2v2 Random Teams")
-    RANDOM3v3 = (6, [3, 3], True, "3v3 Random Teams")
-    RANDOM4v4 = (8, [4, 4], True, "4v4 Random Teams")
-    RANDOM5v5 = (10, [5, 5], True, "5v5 Random Teams")
-    RANDOM2v2v2 = (6, [2, 2, 2], True, "2v2v2 Random Teams")
-    RANDOM3v3v3 = (9, [3, 3, 3], True, "3v3v3 Random Teams")
-    RANDOM4v4v4 = (12, [4, 4, 4], True, "4v4v4 Random Teams")
-    RANDOM2v2v2v2 = (8, [2, 2, 2, 2], True, "2v2v2v2 Random Teams")
-    RANDOM3v3v3v3 = (12, [3, 3, 3, 3], True, "3v3v3v3 Random Teams")
-    RANDOM2v2v2v2v2 = (10, [2, 2, 2, 2, 2], True, "2v2v2v2v2 Random Teams")
-    RANDOM2v2v2v2v2v2 = (12, [2, 2, 2, 2, 2, 2], True, "2v2v2v2v2v2 Random Teams")
-    AI = (0, [], False, "vs AI")
-
-    def __init__(self, player_num, teams, random, full_name):
-        self.player_num = player_num
-        self.teams = teams
-        self.random = random
-        self.full_name = full_name
+import json
+from types import MappingProxyType
+from typing import Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+
+# A game mode. Using a tuple of team sizes instead of a number of teams, since
+# there may be asymmetrical game modes. player_num is 0 for modes where the
+# creator picks the number of players.
+class GameMode(NamedTuple):
+    name: str
+    player_num: int
+    teams: Tuple[int, ...]
+    random: bool
+
+    def shape(self) -> Optional[Tuple[int, int, bool]]:
+        """
+        (team count, team size, random) for modes whose teams are all the same
+        size; None for asymmetrical ones, and for modes without teams, which
+        the shape can't tell apart (FFA and 1v1 would both be (0, 0)).
+        """
+        if len(self.teams) == 0 or len(set(self.teams)) > 1:
+            return None
+        return len(self.teams), self.teams[0], self.random
+
+
+# The modes every database starts with. More can be added through a game modes
+# file, see read_game_modes_file, or straight into the modes table.
+DEFAULT_GAME_MODES = (
+    GameMode("FFA", 0, (), True),
+    GameMode("1v1", 2, (), False),
+    GameMode("2v2 Fixed Teams", 4, (2, 2), False),
+    GameMode("3v3 Fixed Teams", 6, (3, 3), False),
+    GameMode("4v4 Fixed Teams", 8, (4, 4), False),
+    GameMode("5v5 Fixed Teams", 10, (5, 5), False),
+    GameMode("2v2v2 Fixed Teams", 6, (2, 2, 2), False),
+    GameMode("3v3v3 Fixed Teams", 9, (3, 3, 3), False),
+    GameMode("4v4v4 Fixed Teams", 12, (4, 4, 4), False),
+    GameMode("2v2v2v2 Fixed Teams", 8, (2, 2, 2, 2), False),
+    GameMode("3v3v3v3 Fixed Teams", 12, (3, 3, 3, 3), False),
+    GameMode("2v2v2v2v2 Fixed Teams", 10, (2, 2, 2, 2, 2), False),
+    GameMode("2v2v2v2v2v2 Fixed Teams", 12, (2, 2, 2, 2, 2, 2), False),
+    GameMode("1v1 Random Teams", 2, (1, 1), True),
+    GameMode("2v2 Random Teams", 4, (2, 2), True),
+    GameMode("3v3 Random Teams", 6, (3, 3), True),
+    GameMode("4v4 Random Teams", 8, (4, 4), True),
+    GameMode("5v5 Random Teams", 10, (5, 5), True),
+    GameMode("2v2v2 Random Teams", 6, (2, 2, 2), True),
+    GameMode("3v3v3 Random Teams", 9, (3, 3, 3), True),
+    GameMode("4v4v4 Random Teams", 12, (4, 4, 4), True),
+    GameMode("2v2v2v2 Random Teams", 8, (2, 2, 2, 2), True),
+    GameMode("3v3v3v3 Random Teams", 12, (3, 3, 3, 3), True),
+    GameMode("2v2v2v2v2 Random Teams", 10, (2, 2, 2, 2, 2), True),
+    GameMode("2v2v2v2v2v2 Random Teams", 12, (2, 2, 2, 2, 2, 2), True),
+    GameMode("vs AI", 0, (), False),
+)
+
+
+def read_game_modes_file(path: str) -> List[GameMode]:
+    """
+    Reads extra game modes from a JSON file holding a list of objects, e.g.
+    [{"name": "6v6 Fixed Teams", "player_num": 12, "teams": [6, 6],
+      "random": false}]
+    """
+    with open(path) as modes_file:
+        return [
+            GameMode(
+                entry["name"],
+                entry["player_num"],
+                tuple(entry["teams"]),
+                entry["random"]
+            )
+            for entry in json.load(modes_file)
+        ]
+
+
+class GameModeRegistry:
+    """
+    Every known game mode, indexed by name and by shape. Starts out with
+    DEFAULT_GAME_MODES; the facade reloads it from the modes table at startup.
+    """
+
+    def __init__(self, game_modes: Iterable[GameMode] = DEFAULT_GAME_MODES):
+        self.by_name: Mapping[str, GameMode] = MappingProxyType({})
+        self.by_shape: Mapping[Tuple[int, int, bool], GameMode] \
+            = MappingProxyType({})
+        self.load(game_modes)
+
+    def load(self, game_modes: Iterable[GameMode]) -> None:
+        """
+        Replaces the known modes. A later mode with the same name as an
+        earlier one takes its place; so does one with the same shape, with a
+        warning, since the earlier one can then only be picked by name.
+        """
+        by_name = {}
+        for game_mode in game_modes:
+            by_name[game_mode.name] = game_mode
+
+        by_shape = {}
+        for game_mode in by_name.values():
+            shape = game_mode.shape()
+            if shape is None:
+                continue
+            if shape in by_shape:
+                print(f"WARNING: game mode {game_mode.name} has the same "
+                      f"teams as {by_shape[shape].name}, and replaces it "
+                      f"when picking a mode by its teams")
+            by_shape[shape] = game_mode
+
+        self.by_name = MappingProxyType(by_name)
+        self.by_shape = MappingProxyType(by_shape)
+
+    def get(self, name: str) -> Optional[GameMode]:
+        return self.by_name.get(name)
+
+    def find(self, team_count: int, team_size: int,
+             random: bool) -> Optional[GameMode]:
+        """
+        The mode with team_count teams of team_size players, if there is one.
+        """
+        return self.by_shape.get((team_count, team_size, random))
+
+    def __iter__(self):
+        return iter(self.by_name.values())
+
+    def __len__(self):
+        return len(self.by_name)
+
+
+mode_registry = GameModeRegistry()
@@ -0,0 +1,120 @@
+from discord import Guild, TextChannel, CategoryChannel
+from discord.utils import find
+from typing import Dict, Optional
+from db.dbfacade import DatabaseFacade
+from db.model import GuildConfig
+from db.property_constants import CREATE_GAME_CHANNEL, JOIN_GAME_CHANNEL, \
+    GAME_CATEGORY_PROPERTY_NAME
+
+
+class GuildConfigs:
+    """
+    The channels the bot uses in each guild, kept by ID and resolved through
+    the guild's channel cache, so that several guilds can share one bot and
+    nothing has to search a guild's channels by name.
+
+    Guilds set up before this existed are configured through the global
+    channel name properties instead. The first time such a guild is asked
+    about, the names are resolved once and the IDs saved for it.
+    """
+
+    def __init__(self):
+        self.configs: Dict[int, GuildConfig] = {}
+
+    async def load(self) -> None:
+        """
+        Reads every guild's config from the database; run once at startup,
+        before any guild is asked about.
+        """
+        self.configs = {
+            int(guild_config.guild_did): guild_config
+            for guild_config in await DatabaseFacade.get_guild_configs()
+        }
+        print(f"Loaded {len(self.configs)} guild configs")
+
+    async def get(self, guild: Guild) -> GuildConfig:
+        guild_config = self.configs.get(guild.id)
+        if guild_config is None:
+            guild_config = await self._from_properties(guild)
+        return guild_config
+
+    async def update(self, guild: Guild, create_channel: TextChannel = None,
+                     join_channel: TextChannel = None,
+                     game_category: CategoryChannel = None) -> GuildConfig:
+        """
+        Saves whichever of the channels are given, keeping the others.
+        """
+        guild_config = await self.get(guild)
+
+        def did_of(channel, current_did):
+            return str(channel.id) if channel is not None else current_did
+
+        guild_config = await DatabaseFacade.save_guild_config(
+            str(guild.id),
+            did_of(create_channel, guild_config.create_channel_did),
+            did_of(join_channel, guild_config.join_channel_did),
+            did_of(game_category, guild_config.game_category_did)
+        )
+        self.configs[guild.id] = guild_config
+        return guild_config
+
+    async def create_channel(self, guild: Guild) -> Optional[TextChannel]:
+        guild_config = await self.get(guild)
+        return self._channel(guild, guild_config.create_channel_did)
+
+    async def join_channel(self, guild: Guild) -> Optional[TextChannel]:
+        guild_config = await self.get(guild)
+        return self._channel(guild, guild_config.join_channel_did)
+
+    async def game_category(self, guild: Guild) -> Optional[CategoryChannel]:
+        guild_config = await self.get(guild)
+        return self._channel(guild, guild_config.game_category_did)
+
+    @staticmethod
+    def _channel(guild: Guild, channel_did: Optional[str]):
+        if channel_did is None:
+            return None
+        return guild.get_channel(int(channel_did))
+
+    async def _from_properties(self, guild: Guild) -> GuildConfig:
+        async def find_did(prop_name, channels):
+            prop = await DatabaseFacade.get_property(prop_name)
+            if prop is None:
+                return None
+            channel = find(lambda channel: channel.name == prop.value, channels)
+            return str(channel.id) if channel is not None else None
+
+        create_channel_did = await find_did(
+            CREATE_GAME_CHANNEL,
+            guild.text_channels
+        )
+        join_channel_did = await find_did(
+            JOIN_GAME_CHANNEL,
+            guild.text_channels
+        )
+        game_category_did = await find_did(
+            GAME_CATEGORY_PROPERTY_NAME,
+            guild.categories
+        )
+
+        # Nothing to save; the properties are looked at again next time, so
+        # that setting them still works for a guild that hasn't run !setup.
+        if create_channel_did is None and join_channel_did is None \
+                and game_category_did is None:
+            guild_config = GuildConfig()
+            guild_config.guild_did = str(guild.id)
+            return guild_config
+
+        print(f"Configuring guild {guild.id} from the channel name properties")
+        guild_config = await DatabaseFacade.save_guild_config(
+            str(guild.id),
+            create_channel_did,
+            join_channel_did,
+            game_category_did
+        )
+        self.configs[guild.id] = guild_config
+        return guild_config
+
+
+# shared by bot_core and the message sequences that post game messages
+guild_configs = GuildConfigs()
@@ -1,6 +1,13 @@
-from discord import Message, User, Reaction, DMChannel
-from discord.abc import Messageable
-from typing import List, Callable, Union
+from discord import Message, User, Reaction, DMChannel, Object, Client, \
+    HTTPException
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Callable, Union, Iterable
+from db.dbfacade import DatabaseFacade
+import asyncio
+import functools
+import json
+import time
 
 
 class MessageSequence:
@@ -36,8 +43,18 @@ class MessageSequence:
     to the message that it sent. This can be useful if multiple responses to
     a single message are required, such as if multiple reactions need to be
     selected by the user before they can proceed.
+
+    A sequence the user hasn't moved along for idle_timeout seconds is
+    dropped by UserMessageStates; subclasses may override it.
+
+    Sequences are saved to the database after every step that moves them
+    along, and restored after a restart through restore(). Subclasses that
+    collect data must extend get_state and set_state with it; subclasses whose
+    constructor takes more than the user must also override restore.
     """
 
+    idle_timeout: float = 30 * 60
+
     def __init__(self, user: User):
         """
         Initializes a sequence. This is all just assigning variables needed for
@@ -59,6 +76,17 @@ class MessageSequence:
         # if this is a PM, the User involved (can be set via the Starter)
         self.user: User = user
 
+        # ID of the newest message seen in the DM channel with self.user, in
+        # either direction; fed from the gateway by UserMessageStates.
+        self.last_seen_message_id: int = None
+
+        # time.monotonic() of the last time the sequence was started or a
+        # handler moved it along; used to expire abandoned sequences.
+        self.last_active: float = time.monotonic()
+
+        # the UserMessageStates holding this sequence, which saves it
+        self.message_states: "UserMessageStates" = None
+
         # TODO: if there need to be message sequences in public channels, the
         #  channel would be stored here instead of a User.
 
@@ -82,7 +110,17 @@ class MessageSequence:
         :return: None
         """
         if self.current_handler is not None:
+            handler = self.current_handler
+            current_message = self.current_message
             await self.current_handler(msg)
+
+            # Handlers ignore messages that aren't for them, and input they
+            # can't use; only a step that moved the sequence along counts as
+            # activity, and is worth a write.
+            if self.current_handler != handler \
+                    or self.current_message is not current_message:
+                self.last_active = time.monotonic()
+                await self.save()
         else:
             print("Sequence has no more messages")
 
@@ -94,8 +132,61 @@ class MessageSequence:
         and communicate with the user via DM.
         :return: None
         """
+        self.last_active = time.monotonic()
         if not self.current_handler:
             await self.starter()
+            await self.save()
+
+    async def save(self) -> None:
+        if self.message_states is not None:
+            await self.message_states.save_user_sequence(self)
+
+    def get_state(self) -> dict:
+        """
+        Returns what is needed to resume the sequence after a restart, as a
+        JSON-serializable dict.
+        """
+        return {
+            "handler": (self.current_handler.__name__
+                        if self.current_handler is not None else None),
+            "current_message": (self.current_message.id
+                                if self.current_message is not None else None),
+            "last_seen_message": self.last_seen_message_id,
+        }
+
+    def set_state(self, state: dict) -> None:
+        """
+        Resumes the sequence from the output of get_state. Only the ID of
+        current_message survives a restart, so handlers must not rely on
+        anything else about it.
+        """
+        if state["handler"] is not None:
+            self.current_handler = getattr(self, state["handler"])
+        if state["current_message"] is not None:
+            self.current_message = Object(id=state["current_message"])
+        self.last_seen_message_id = state["last_seen_message"]
+
+    @classmethod
+    def restore(cls, user: User, state: dict, client: Client):
+        """
+        Rebuilds a sequence from the output of get_state, or returns None if
+        it can't be yet, e.g. while the guilds it needs are still arriving
+        from the gateway.
+        """
+        message_sequence = cls(user)
+        message_sequence.set_state(state)
+        return message_sequence
+
+    def is_expired(self, now: float) -> bool:
+        return now - self.last_active > self.idle_timeout
+
+    def is_done(self) -> bool:
+        """
+        True once the sequence has sent its first message and then passed
+        None as the next handler. Unlike is_finished, this is False for a
+        sequence that is still being started.
+        """
+        return self.current_handler is None and self.current_message is not None
 
     async def is_started(self) -> bool:
         """
@@ -125,6 +216,9 @@ class MessageSequence:
         :return: copy of function decorated with internal_call
         """
 
+        # wraps keeps the handler's name, which is how saved sequences refer
+        # to their current handler.
+        @functools.wraps(handler)
         async def internal_call(self, message: Message):
             """
             locally defined function is part of making a decorator.
@@ -165,6 +259,7 @@ class MessageSequence:
         :param handler: the function that this decorates
         :return: copy of function decorated with internal_call
         """
+        @functools.wraps(handler)
         async def internal_call(self, message: Message):
             """
             locally defined function is part of making a decorator.
@@ -177,35 +272,64 @@ class MessageSequence:
             :return: handler, decorated with this function.
             """
 
-            channel: Messageable = message.channel
-            hist_list = await channel.history(limit=1).flatten()
-
-            if len(hist_list) != 1:
-                print("error in getting channel history; got {} messages"
-                      .format(len(hist_list)))
+            if message.id == self.current_message.id:
+                print("reaction to current message received on non-reaction"
+                      " handler: {}".format(self.user.display_name))
+            elif not isinstance(message.channel, DMChannel):
+                # received new message, but it's in the wrong channel
+                pass
+            elif self.last_seen_message_id == message.id:
+                # the message is still the newest one in the DM channel
+                return await handler(self, message)
             else:
-                most_recent_message: Message = hist_list[0]
-                if message.id == self.current_message.id:
-                    print("reaction to current message received on non-reaction"
-                          " handler: {}".format(self.user.display_name))
-                elif not isinstance(message.channel, DMChannel):
-                    # received new message, but it's in the wrong channel
-                    pass
-                elif most_recent_message.id == message.id:
-                    return await handler(self, message)
-                else:
-                    return
+                return
 
         return internal_call
 
+    # reaction seeding tasks that are still running; the event loop only
+    # keeps weak references to tasks
+    seeding_tasks = set()
+
+    @staticmethod
+    def seed_reactions(message: Message,
+                       emojis: Iterable[str]) -> asyncio.Task:
+        """
+        Adds the emojis to message as reaction buttons, in order, on a
+        background task, and returns the task straight away. The user can
+        react as soon as the message is up, so the caller can send it, seed
+        it, and pass_handler without waiting on a round trip per button.
+
+        The reactions go out one at a time so that they show up in order;
+        discord.py already queues them in the reaction route's rate limit
+        bucket, so sending them concurrently would not make them land sooner.
+
+        :param message: Message to add the reactions to.
+        :param emojis: Emojis to add, in the order they should appear.
+        :return: the task adding the reactions.
+        """
+        async def add_reactions():
+            for emoji in emojis:
+                try:
+                    await message.add_reaction(emoji)
+                except HTTPException as e:
+                    # most likely the message was deleted in the meantime
+                    print(f"ERROR: while adding reaction {emoji}, got "
+                          f"exception of type {type(e)}")
+                    return
+
+        task = asyncio.get_event_loop().create_task(add_reactions())
+        MessageSequence.seeding_tasks.add(task)
+        task.add_done_callback(MessageSequence.seeding_tasks.discard)
+        return task
+
     @staticmethod
     def get_reactions_added(message: Message) -> List[Reaction]:
         """
-        Returns a list of Reaction objects for each Reaction that has count > 1;
+        Returns a list of Reaction objects for each Reaction the user added;
         as long as this is only used in private channels, it should guarantee
-        that all Reactions returned were reacted to by the target user; any that
-        they add would have a count of 1, as would any the bot added which the
-        user has not reacted to.
+        that all Reactions returned were reacted to by the target user. Those
+        are the ones with count > 1, since the bot reacted too, plus any the
+        user got to before seed_reactions added the bot's.
 
         :param message: Message to check reactions for.
         :return: list of Reactions to the message.
@@ -213,7 +337,7 @@ class MessageSequence:
         message_reactions: List[Reaction] = message.reactions
         added_reactions: List[Reaction] = []
         for reaction in message_reactions:
-            if reaction.count > 1:
+            if reaction.count > 1 or not reaction.me:
                 added_reactions.append(reaction)
 
         return added_reactions
@@ -225,10 +349,38 @@ class UserMessageStates:
 
     A user may only have one active MessageSequence at a time. Starting a new
     one overwrites any old ones.
+
+    At most capacity sequences are kept; past that, the least recently
+    started one is evicted. Sequences idle for longer than their
+    idle_timeout expire, and finished ones are dropped by run_sweeper().
+
+    Unfinished sequences are also kept in the database, and are brought back
+    by load_user_sequence the first time their user interacts with the bot
+    after a restart (or after being evicted). Only the sequence_types given
+    can be restored.
     """
 
-    def __init__(self):
-        self.user_message_states = {}
+    def __init__(self, client: Client = None,
+                 sequence_types: Iterable[type] = (), capacity: int = 1000):
+        self.client = client
+        self.sequence_types = {
+            sequence_type.__name__: sequence_type
+            for sequence_type in sequence_types
+        }
+        self.capacity = capacity
+        self.user_message_states: OrderedDict = OrderedDict()
+
+        # users whose saved sequence has already been looked for, least
+        # recently checked first. Users whose sequence is evicted or expires
+        # are forgotten, so that it is looked for again; past capacity, the
+        # least recently checked are too.
+        self.checked_users: OrderedDict = OrderedDict()
+
+        # sequences dropped for being idle, for the table being over capacity,
+        # and for having finished
+        self.expired = 0
+        self.evicted = 0
+        self.finished = 0
 
     async def add_user_sequence(self, user: User, message_sequence: MessageSequence):
         """
@@ -241,9 +393,120 @@ class UserMessageStates:
         print("Added new message sequence {0} for user {1}, and started it."
               .format(str(type(message_sequence)), user.name))
         self.user_message_states[user.id] = message_sequence
+        self.user_message_states.move_to_end(user.id)
+        message_sequence.message_states = self
+
+        while len(self.user_message_states) > self.capacity:
+            evicted_id, _ = self.user_message_states.popitem(last=False)
+            # so that load_user_sequence brings the sequence back
+            self.checked_users.pop(evicted_id, None)
+            self.evicted += 1
 
     def get_user_sequence(self, user: User):
-        if user.id in self.user_message_states.keys():
-            return self.user_message_states[user.id]
-        else:
+        message_sequence: MessageSequence \
+            = self.user_message_states.get(user.id)
+
+        if message_sequence is not None \
+                and message_sequence.is_expired(time.monotonic()):
+            del self.user_message_states[user.id]
+            self.checked_users.pop(user.id, None)
+            self.expired += 1
+            return None
+
+        return message_sequence
+
+    async def load_user_sequence(self, user: User):
+        """
+        get_user_sequence, falling back to the sequence saved in the database
+        when the user has none in memory and hasn't been checked recently.
+        """
+        message_sequence = self.get_user_sequence(user)
+        if message_sequence is not None:
+            return message_sequence
+        if user.id in self.checked_users:
+            self.checked_users.move_to_end(user.id)
+            return None
+
+        self.checked_users[user.id] = True
+        while len(self.checked_users) > self.capacity:
+            self.checked_users.popitem(last=False)
+
+        saved = await DatabaseFacade.get_sequence_state(str(user.id))
+        if saved is None or saved.sequence_type not in self.sequence_types:
+            return None
+
+        message_sequence = self.sequence_types[saved.sequence_type].restore(
+            user,
+            json.loads(saved.state),
+            self.client
+        )
+        if message_sequence is None:
+            # try again the next time the user interacts with the bot
+            self.checked_users.pop(user.id, None)
             return None
+
+        print(f"Restoring {saved.sequence_type} for user {user.name}")
+        await self.add_user_sequence(user, message_sequence)
+        return message_sequence
+
+    async def save_user_sequence(self, message_sequence: MessageSequence):
+        user_did = str(message_sequence.user.id)
+        if message_sequence.is_done():
+            await DatabaseFacade.delete_sequence_state(user_did)
+            return
+
+        await DatabaseFacade.save_sequence_state(
+            user_did,
+            type(message_sequence).__name__,
+            json.dumps(message_sequence.get_state(), separators=(",", ":")),
+            datetime.utcnow()
+            + timedelta(seconds=message_sequence.idle_timeout)
+        )
+
+    def observe_message(self, message: Message) -> None:
+        """
+        Records a message seen on the gateway as the newest in its DM channel,
+        for the sequence of the user on the other end. Call this for every
+        message received, the bot's own included.
+        """
+        if not isinstance(message.channel, DMChannel):
+            return
+
+        message_sequence: MessageSequence = self.user_message_states.get(
+            message.channel.recipient.id
+        )
+        if message_sequence is not None:
+            message_sequence.last_seen_message_id = message.id
+
+    def sweep(self) -> None:
+        """
+        Drops every expired or finished sequence.
+        """
+        now = time.monotonic()
+        for user_id, message_sequence \
+                in list(self.user_message_states.items()):
+            if message_sequence.is_done():
+                del self.user_message_states[user_id]
+                self.finished += 1
+            elif message_sequence.is_expired(now):
+                del self.user_message_states[user_id]
+                self.checked_users.pop(user_id, None)
+                self.expired += 1
+
+    async def run_sweeper(self, interval: float = 60) -> None:
+        """
+        Sweeps every interval seconds, forever; run as a background task.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+            try:
+                await DatabaseFacade.delete_expired_sequence_states()
+            except Exception as e:
+                print(f"ERROR: While deleting expired sequences, got "
+                      f"exception of type {type(e)}")
+
+    def stats(self) -> str:
+        return (f"sequences: {len(self.user_message_states)} active, "
+                f"{self.expired} expired, {self.evicted} evicted, "
+                f"{self.finished} finished")
@@ -6,6 +6,8 @@ import unicode_constants
 
 class MessageSequenceTest(MessageSequence):
 
+    idle_timeout = 10 * 60
+
     def __init__(self, user: User):
         super().__init__(user)
         self.value_1 = None
@@ -30,7 +32,10 @@ class MessageSequenceTest(MessageSequence):
         starter_embed.description = msg
 
         starter_msg = await self.user.send(embed=starter_embed)
-        await starter_msg.add_reaction(unicode_constants.UNICODE_FORWARD_ARROW)
+        self.seed_reactions(
+            starter_msg,
+            [unicode_constants.UNICODE_FORWARD_ARROW]
+        )
         self.current_message = starter_msg
         self.pass_handler(self.handle_text_reply)
 
@@ -63,10 +68,12 @@ class MessageSequenceTest(MessageSequence):
 
         # this is how reactions are added to the message you just sent. In this
         # case, the codes for 1/2/3/4 are used.
-        await msg.add_reaction(unicode_constants.UNICODE_1)
-        await msg.add_reaction(unicode_constants.UNICODE_2)
-        await msg.add_reaction(unicode_constants.UNICODE_3)
-        await msg.add_reaction(unicode_constants.UNICODE_4)
+        self.seed_reactions(msg, [
+            unicode_constants.UNICODE_1,
+            unicode_constants.UNICODE_2,
+            unicode_constants.UNICODE_3,
+            unicode_constants.UNICODE_4,
+        ])
 
         self.pass_handler(self.handler_react_reply)
 
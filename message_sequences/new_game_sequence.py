@@ -1,17 +1,22 @@
 from message import MessageSequence
-from discord import User, Embed, Message, Emoji, Guild, TextChannel
-from discord.utils import find
+from discord import User, Embed, Message, Emoji, Guild, TextChannel, Client
 from unicode_constants import UNICODE_1, UNICODE_2, UNICODE_3, \
     UNICODE_FORWARD_ARROW, UNICODE_0, UNICODE_4, UNICODE_5, UNICODE_6
 from db.dbfacade import DatabaseFacade
-from db.property_constants import GAME_CATEGORY_PROPERTY_NAME, JOIN_GAME_CHANNEL
 from db.model import Game
-from game_modes import GameMode
+from game_modes import mode_registry
+from routing import message_routes, MessageKind
+from guild_config import guild_configs
+from summaries import summary_embed
+from channel_pool import channel_pool
 import unicodedata as ud
 
 
 class NewGameSequence(MessageSequence):
 
+    # writing up a game description can take a while
+    idle_timeout = 60 * 60
+
     def __init__(self, user: User, guild: Guild):
         super().__init__(user)
         self.starter = self.initial_message
@@ -34,6 +39,37 @@ class NewGameSequence(MessageSequence):
 
         self.game: Game = None
 
+    def get_state(self) -> dict:
+        state = super().get_state()
+        state.update({
+            "guild": self.guild_reference.id,
+            "platform": self.platform_choice,
+            "team_count": self.team_count,
+            "team_size": self.team_size,
+            "mode": self.mode_str,
+            "description": self.game_description,
+        })
+        return state
+
+    def set_state(self, state: dict) -> None:
+        super().set_state(state)
+        self.platform_choice = state["platform"]
+        self.team_count = state["team_count"]
+        self.team_size = state["team_size"]
+        self.mode_str = state["mode"]
+        self.game_description = state["description"]
+
+    @classmethod
+    def restore(cls, user: User, state: dict, client: Client):
+        guild = client.get_guild(state["guild"])
+        if guild is None:
+            # not received from the gateway yet, or the bot has left it
+            return None
+
+        message_sequence = cls(user, guild)
+        message_sequence.set_state(state)
+        return message_sequence
+
     async def initial_message(self) -> None:
         title = "New Game!"
         desc = "What platform are you playing on?" \
@@ -49,9 +85,7 @@ class NewGameSequence(MessageSequence):
 
         self.current_message = initial_message
 
-        await initial_message.add_reaction(UNICODE_1)
-        await initial_message.add_reaction(UNICODE_2)
-        await initial_message.add_reaction(UNICODE_3)
+        self.seed_reactions(initial_message, [UNICODE_1, UNICODE_2, UNICODE_3])
 
         self.pass_handler(self.platform_handler)
 
@@ -152,10 +186,6 @@ class NewGameSequence(MessageSequence):
         else:
             self.team_size = team_size
 
-        self.mode_str = ((str(self.team_size) + "v")
-                         * (self.team_count - 1)
-                         + str(self.team_size))
-
         await self.team_assignment_message()
         self.pass_handler(self.team_assignment_handler)
 
@@ -171,8 +201,7 @@ class NewGameSequence(MessageSequence):
 
         msg = await self.user.send(embed=assign_embed)
         self.current_message = msg
-        await msg.add_reaction(UNICODE_1)
-        await msg.add_reaction(UNICODE_2)
+        self.seed_reactions(msg, [UNICODE_1, UNICODE_2])
 
     @MessageSequence.requires_reaction
     async def team_assignment_handler(self, message: Message):
@@ -188,13 +217,30 @@ class NewGameSequence(MessageSequence):
             reaction = reactions[0]
             emoji = reaction.emoji
             if emoji == UNICODE_1:
-                self.mode_str += " Fixed Teams"
+                random = False
             elif emoji == UNICODE_2:
-                self.mode_str += " Random Teams"
+                random = True
             else:
                 print(f"invalid reaction: {str(emoji)}")
                 return
 
+            game_mode = mode_registry.find(
+                self.team_count,
+                self.team_size,
+                random
+            )
+            if game_mode is None:
+                await self.user.send(
+                    "There is no {0} mode with {1} teams of {2}".format(
+                        "random" if random else "fixed",
+                        self.team_count,
+                        self.team_size
+                    )
+                )
+                return
+
+            self.mode_str = game_mode.name
+
             await self.game_description_message()
             self.pass_handler(self.game_description_handler)
 
@@ -263,8 +309,7 @@ class NewGameSequence(MessageSequence):
         msg = await self.user.send(embed=confirm_embed)
         self.current_message = msg
 
-        await msg.add_reaction(UNICODE_1)
-        await msg.add_reaction(UNICODE_2)
+        self.seed_reactions(msg, [UNICODE_1, UNICODE_2])
 
     @MessageSequence.requires_reaction
     async def user_confirm_handler(self, message: Message):
@@ -281,35 +326,47 @@ class NewGameSequence(MessageSequence):
             emoji: Emoji = reactions[0].emoji
 
             if emoji == UNICODE_1:
+                # nowhere to announce the game means nobody could join it
+                if await guild_configs.join_channel(self.guild_reference) \
+                        is None:
+                    await self.no_join_channel_message()
+                    return
+
                 # TODO: Add game message in public channel, and pass instead of
                 #  empty string
-                target_mode = None
-                for mode in GameMode:
-                    if mode.value[3] == self.mode_str:
-                        target_mode = mode
+                target_mode = mode_registry.get(self.mode_str)
 
                 if target_mode is not None:
                     print(f"found a mode with modestring {self.mode_str}")
-                    if target_mode.value[3] == "FFA":
-                        self.game = DatabaseFacade.add_game(
+                    if target_mode.name == "FFA":
+                        self.game = await DatabaseFacade.add_game(
                             str(self.user.id),
                             self.platform_choice,
-                            target_mode.value,
+                            target_mode,
                             "",
-                            max_size=self.team_size
+                            max_size=self.team_size,
+                            description=self.game_description
                         )
                     else:
-                        self.game = DatabaseFacade.add_game(
+                        self.game = await DatabaseFacade.add_game(
                             str(self.user.id),
                             self.platform_choice,
-                            target_mode.value,
+                            target_mode,
                             "",
+                            description=self.game_description
                         )
 
+                    # the summaries render the creator and roster too
+                    self.game = await DatabaseFacade.get_game_by_id(
+                        self.game.id
+                    )
+
                     await self.create_game_channel()
 
                     await self.game_public_message()
 
+                    self.pass_handler(None)
+
                 else:
                     print(f"Unrecognized mode: {self.mode_str}")
                     return None
@@ -329,61 +386,38 @@ class NewGameSequence(MessageSequence):
                 await self.initial_message()
 
     async def create_game_channel(self):
-        game_category = DatabaseFacade.get_property(
-            GAME_CATEGORY_PROPERTY_NAME
-        )
-
-        print(f"Searching for category: {game_category.value}")
-
         game_id: str = str(self.game.id)
-        game_category = find(
-            lambda cat: cat.name == game_category.value,
-            self.guild_reference.categories
-        )
 
-        print("Game categories: ")
-        for category in self.guild_reference.categories:
-            print(category.name)
-
-        channel: TextChannel = await self.guild_reference.create_text_channel(
-            name=f"Game-{game_id}",
-            category=game_category
+        # a spare from the pool, or a new channel if there is none
+        game_channel = await channel_pool.acquire(
+            self.guild_reference,
+            f"Game-{game_id}"
         )
+        channel: TextChannel = game_channel.channel
 
-        DatabaseFacade.update_game(
+        await DatabaseFacade.update_game(
             self.game.id,
-            channel_did=str(channel.id)
+            channel_did=str(channel.id),
+            role_did=(str(game_channel.role.id)
+                      if game_channel.role is not None else None)
         )
 
-        await channel.set_permissions(
-            self.user,
-            read_messages=True
-        )
+        await game_channel.let_in(self.user)
         await self.game_channel_message(channel)
 
     async def game_channel_message(self, channel):
-        game_summary_embed = Embed()
-
-        game_summary_embed.title = ("-" * 20) + f"Game {self.game.id} Summary" \
-            + ("-" * 20)
-
-        max_players = self.game.teams[0].size
-        game_summary_embed.description = (
-                f"Created by: {self.user.mention}\n"
-                + f"Mode: {self.mode_str} "
-                + (f"({max_players})" if self.mode_str == "FFA" else "") + "\n"
-                + f"Platform: {self.platform_choice}\n"
-                + f"Description: {self.game_description}\n"
-                + ("" if self.game.mode.name == "FFA" or self.game.randomize_teams
-                   else f"React to join a team (team 0 = no team)")
-        )
-
-        game_summary_msg = await channel.send(embed=game_summary_embed)
+        # kept up to date from here on by GameSummaries
+        game_summary_msg = await channel.send(embed=summary_embed(self.game))
 
-        DatabaseFacade.update_game(
+        await DatabaseFacade.update_game(
             self.game.id,
             game_message_did=str(game_summary_msg.id)
         )
+        message_routes.add(
+            game_summary_msg.id,
+            MessageKind.GAME_SUMMARY,
+            self.game.id
+        )
 
         team_emoji = [UNICODE_0, UNICODE_1, UNICODE_2, UNICODE_3, UNICODE_4,
                        UNICODE_5, UNICODE_6]
@@ -391,40 +425,35 @@ class NewGameSequence(MessageSequence):
         if self.game.randomize_teams:
             pass
         else:
-            for team in self.game.teams:
-                emoji = team_emoji[team.number]
-                await game_summary_msg.add_reaction(emoji)
-
-    async def game_public_message(self):
-
-        game_summary_embed = Embed()
-
-        game_summary_embed.title = ("-" * 20) + f"Game {self.game.id} Summary" \
-                                   + ("-" * 20)
+            self.seed_reactions(
+                game_summary_msg,
+                [team_emoji[team.number] for team in self.game.teams]
+            )
 
-        max_players = self.game.teams[0].size
-        game_summary_embed.description = (
-                "React to join!\n"
-                + f"Created by: {self.user.mention}\n"
-                + f"Mode: {self.mode_str} "
-                + (f"({max_players})" if self.mode_str == "FFA" else "") + "\n"
-                + f"Platform: {self.platform_choice}\n"
-                + f"Platform: {self.platform_choice}\n"
-                + f"Description: {self.game_description}\n"
+    async def no_join_channel_message(self):
+        await self.user.send(
+            "This server has no channel to announce games in yet. Ask an "
+            "admin to run '!setup join' in it, then react again."
         )
 
-        channel_prop = DatabaseFacade.get_property(JOIN_GAME_CHANNEL)
-        channel_name = channel_prop.value
-
-        channel: TextChannel = find(
-            lambda channel: channel.name == channel_name,
-            self.guild_reference.channels
+    async def game_public_message(self):
+        channel: TextChannel = await guild_configs.join_channel(
+            self.guild_reference
         )
+        if channel is None:
+            # the channel was deleted since the game was confirmed
+            await self.no_join_channel_message()
+            return
 
-        game_message = await channel.send(embed=game_summary_embed)
+        # kept up to date from here on by GameSummaries
+        game_message = await channel.send(
+            embed=summary_embed(self.game, public=True)
+        )
 
-        DatabaseFacade.update_game(
+        await DatabaseFacade.update_game(
             self.game.id,
-            message_did=str(game_message.id)
+            message_did=str(game_message.id),
+            message_channel_did=str(channel.id)
         )
-        await game_message.add_reaction(UNICODE_FORWARD_ARROW)
+        message_routes.add(game_message.id, MessageKind.JOIN_GAME, self.game.id)
+        self.seed_reactions(game_message, [UNICODE_FORWARD_ARROW])
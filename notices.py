@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from discord import TextChannel, HTTPException
+from typing import Dict, List
+
+
+# discord won't take longer messages
+MAX_MESSAGE_LENGTH = 2000
+
+
+class RateLimitWaits(logging.Handler):
+    """
+    Counts the rate limit waits discord.py reports. It sleeps through them
+    itself and only logs them, so its log is the one place they show up.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.waits = 0
+        self.seconds = 0.0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        message = str(record.msg)
+        if not (message.startswith("We are being rate limited")
+                or message.startswith("Global rate limit")):
+            return
+        self.waits += 1
+        if record.args:
+            self.seconds += float(record.args[0])
+
+
+class ChannelNotices:
+    """
+    Queues short notices for posting in a channel, and posts whatever arrives
+    within window seconds of each other as a single message. A burst of team
+    changes at lobby fill then costs one or two sends instead of one each,
+    which keeps the channel clear of its rate limit.
+
+    Each channel with notices waiting has one task draining its queue, so the
+    sends to a channel go out in order, one at a time.
+    """
+
+    def __init__(self, window: float = 1.0):
+        self.window = window
+
+        # channel id -> notices not yet sent
+        self.queues: Dict[int, List[str]] = {}
+        self.drains: Dict[int, asyncio.Task] = {}
+
+        self.posted = 0
+        self.sent = 0
+        self.max_depth = 0
+
+        self.rate_limits = RateLimitWaits()
+        logging.getLogger("discord.http").addHandler(self.rate_limits)
+
+    def post(self, channel: TextChannel, notice: str) -> None:
+        queue = self.queues.setdefault(channel.id, [])
+        queue.append(notice)
+        self.posted += 1
+        self.max_depth = max(self.max_depth, len(queue))
+
+        if channel.id not in self.drains:
+            self.drains[channel.id] = asyncio.get_event_loop().create_task(
+                self._drain(channel)
+            )
+
+    async def _drain(self, channel: TextChannel) -> None:
+        try:
+            while len(self.queues.get(channel.id, [])) > 0:
+                # let the rest of the burst come in
+                await asyncio.sleep(self.window)
+                notices = self.queues.pop(channel.id)
+
+                for content in self._messages(notices):
+                    try:
+                        await channel.send(content=content)
+                        self.sent += 1
+                    except HTTPException as e:
+                        print(f"ERROR: while posting notices to {channel}, "
+                              f"got exception of type {type(e)}")
+        finally:
+            del self.drains[channel.id]
+
+    @staticmethod
+    def _messages(notices: List[str]) -> List[str]:
+        """
+        Joins the notices into as few messages as fit discord's limit.
+        """
+        messages = []
+        current = ""
+        for notice in notices:
+            if current and len(current) + 1 + len(notice) > MAX_MESSAGE_LENGTH:
+                messages.append(current)
+                current = ""
+            current = f"{current}\n{notice}" if current else notice
+        if current:
+            messages.append(current)
+        return messages
+
+    def stats(self) -> str:
+        depth = sum(len(queue) for queue in self.queues.values())
+        return (f"notices: {self.posted} posted in {self.sent} messages, "
+                f"{depth} queued (max {self.max_depth}); "
+                f"{self.rate_limits.waits} rate limit waits "
+                f"({self.rate_limits.seconds:.1f}s)")
+
+
+# shared by every handler that posts notices in game channels
+channel_notices = ChannelNotices()
@@ -0,0 +1,97 @@
+from enum import Enum
+from typing import Dict, NamedTuple, Optional
+from db.dbfacade import DatabaseFacade
+from db.property_constants import CREATE_GAME_MESSAGES
+
+
+class MessageKind(Enum):
+    # a !scrims message; reacting starts a NewGameSequence
+    CREATE_GAME = "create game"
+    # a game's message in the join channel; reacting joins the game
+    JOIN_GAME = "join game"
+    # a game's summary message in its own channel; reacting picks a team
+    GAME_SUMMARY = "game summary"
+
+
+class MessageRoute(NamedTuple):
+    kind: MessageKind
+    game_id: Optional[int]
+
+
+class MessageRoutes:
+    """
+    Maps the IDs of the guild messages the bot reacts to onto what they are
+    for, so that on_raw_reaction_add can tell from the payload alone whether a
+    reaction concerns us. Built from the games table by load(), and kept
+    current by whoever posts or deletes one of these messages.
+
+    DM sequence messages are not kept here; a DM reaction is routed by the
+    reacting user's sequence, through its current_message.
+    """
+
+    def __init__(self):
+        self.routes: Dict[int, MessageRoute] = {}
+
+    async def load(self) -> None:
+        """
+        Rebuilds the table from the database; run once at startup, before
+        any reaction is handled.
+        """
+        routes: Dict[int, MessageRoute] = {}
+
+        create_prop = await DatabaseFacade.get_property(CREATE_GAME_MESSAGES)
+        if create_prop is not None:
+            for message_did in create_prop.value.split():
+                routes[int(message_did)] = MessageRoute(
+                    MessageKind.CREATE_GAME,
+                    None
+                )
+
+        for game_id, message_did, game_message_did \
+                in await DatabaseFacade.get_game_message_dids():
+            if message_did:
+                routes[int(message_did)] = MessageRoute(
+                    MessageKind.JOIN_GAME,
+                    game_id
+                )
+            if game_message_did:
+                routes[int(game_message_did)] = MessageRoute(
+                    MessageKind.GAME_SUMMARY,
+                    game_id
+                )
+
+        self.routes = routes
+        print(f"Loaded {len(self.routes)} message routes")
+
+    def get(self, message_id: int) -> Optional[MessageRoute]:
+        return self.routes.get(message_id)
+
+    def add(self, message_id: int, kind: MessageKind,
+            game_id: int = None) -> None:
+        self.routes[message_id] = MessageRoute(kind, game_id)
+
+    async def add_create_message(self, message_id: int) -> None:
+        """
+        Routes a new !scrims message, and records it so that load() can find
+        it again after a restart.
+        """
+        self.add(message_id, MessageKind.CREATE_GAME)
+
+        create_message_dids = [
+            str(route_id) for route_id, route in self.routes.items()
+            if route.kind == MessageKind.CREATE_GAME
+        ]
+        await DatabaseFacade.set_property(
+            CREATE_GAME_MESSAGES,
+            " ".join(create_message_dids)
+        )
+
+    def remove_game(self, game_id: int) -> None:
+        self.routes = {
+            message_id: route for message_id, route in self.routes.items()
+            if route.game_id != game_id
+        }
+
+
+# shared by bot_core and the message sequences that post game messages
+message_routes = MessageRoutes()
@@ -0,0 +1,144 @@
+import asyncio
+from discord import Client, Embed, HTTPException
+from typing import Dict, Optional, Set
+from db.dbfacade import DatabaseFacade
+from db.model import Game
+from db import lookup
+
+
+def summary_embed(game: Game, public: bool = False) -> Embed:
+    """
+    Renders a game's summary: the embed in its own channel, or with public
+    set, the one in the join channel. game needs its creator and its teams'
+    players loaded, as by the "summary" load profile.
+
+    Players are listed as mentions, which discord shows as names inside an
+    embed without pinging anyone, so rendering takes no API calls.
+    """
+    mode_name = lookup.modes.name_of(game.mode_id)
+    max_players = game.teams[0].size
+
+    if game.started_at is not None:
+        status = "In progress"
+    elif game.is_full():
+        status = "Full"
+    else:
+        status = "Waiting for players"
+
+    lines = []
+    if public and status == "Waiting for players":
+        lines.append("React to join!")
+    lines += [
+        f"Created by: <@{game.creator.did}>",
+        f"Mode: {mode_name}"
+        + (f" ({max_players})" if mode_name == "FFA" else ""),
+        f"Platform: {lookup.platforms.name_of(game.platform_id)}",
+    ]
+    if game.description is not None:
+        lines.append(f"Description: {game.description}")
+    lines += [
+        f"Players: {game.player_number}/{max_players}",
+        f"Status: {status}",
+    ]
+    if not public and game.started_at is None \
+            and not (mode_name == "FFA" or game.randomize_teams):
+        lines.append("React to join a team (team 0 = no team)")
+
+    embed = Embed()
+    embed.title = ("-" * 20) + f"Game {game.id} Summary" + ("-" * 20)
+    embed.description = "\n".join(lines)
+
+    for team in game.teams:
+        if team.number == 0 and game.teams_available:
+            name = "No team"
+        elif team.number == 0:
+            name = "Players"
+        else:
+            name = f"Team {team.number} ({len(team.players)}/{team.size})"
+
+        # sorted, so that an unchanged roster renders the same every time
+        mentions = sorted(f"<@{player.did}>" for player in team.players)
+        embed.add_field(
+            name=name,
+            value="\n".join(mentions) if len(mentions) > 0 else "(empty)",
+            inline=True
+        )
+
+    return embed
+
+
+class GameSummaries:
+    """
+    Keeps each game's two summary embeds current. Handlers call refresh()
+    after changing a game; window seconds after the first change, the
+    summaries are re-rendered and edited in place, taking in every change
+    made meanwhile. A burst of changes costs one edit per message per window,
+    however long the burst goes on.
+    """
+
+    def __init__(self, client: Client, window: float = 2.0):
+        self.client = client
+        self.window = window
+
+        # games changed since their summaries were last rendered
+        self.stale: Set[int] = set()
+        self.refreshes: Dict[int, asyncio.Task] = {}
+
+        self.requested = 0
+        self.edits = 0
+
+    def refresh(self, game_id: int) -> None:
+        self.requested += 1
+        self.stale.add(game_id)
+        if game_id not in self.refreshes:
+            self.refreshes[game_id] = asyncio.get_event_loop().create_task(
+                self._refresh(game_id)
+            )
+
+    async def _refresh(self, game_id: int) -> None:
+        try:
+            while game_id in self.stale:
+                await asyncio.sleep(self.window)
+                self.stale.discard(game_id)
+
+                game: Game = await DatabaseFacade.get_game_by_id(game_id)
+                if game is None:
+                    # deleted in the meantime
+                    return
+
+                await self._edit(
+                    game.channel_id,
+                    game.game_message_did,
+                    summary_embed(game)
+                )
+                await self._edit(
+                    game.message_channel_id,
+                    game.message_did,
+                    summary_embed(game, public=True)
+                )
+        finally:
+            # a failed load, or a deleted game, must not leave the game
+            # marked stale for good
+            self.stale.discard(game_id)
+            del self.refreshes[game_id]
+
+    async def _edit(self, channel_did: Optional[str],
+                    message_did: Optional[str], embed: Embed) -> None:
+        if not channel_did or not message_did:
+            return
+        channel = self.client.get_channel(int(channel_did))
+        if channel is None:
+            return
+
+        try:
+            await channel.get_partial_message(int(message_did)).edit(
+                embed=embed
+            )
+            self.edits += 1
+        except HTTPException as e:
+            print(f"ERROR: while editing summary {message_did}, got exception "
+                  f"of type {type(e)}")
+
+    def stats(self) -> str:
+        return (f"summaries: {self.requested} refreshes requested, "
+                f"{self.edits} edits, {len(self.refreshes)} pending")
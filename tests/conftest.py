@@ -0,0 +1,46 @@
+import os
+import sys
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db.dbfacade
+from db.dbfacade import DatabaseFacade
+from db.cache import PlayerIdCache
+
+
+class StatementCounter:
+    """
+    Counts the statements and commits the facade's async engine runs, so that
+    tests can check how many round trips an operation costs.
+    """
+
+    def __init__(self, engine):
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._statement)
+        event.listen(engine, "commit", self._commit)
+
+    def _statement(self, *args):
+        self.statements += 1
+
+    def _commit(self, *args):
+        self.commits += 1
+
+    def reset(self) -> None:
+        self.statements = 0
+        self.commits = 0
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch) -> StatementCounter:
+    """
+    Sets DatabaseFacade up on a fresh SQLite database, seeded as at startup,
+    and returns a counter of the statements run on it.
+    """
+    # player ids cached against another test's database would be wrong here
+    monkeypatch.setattr(DatabaseFacade, "player_id_cache", PlayerIdCache())
+    DatabaseFacade(f"sqlite:///{tmp_path / 'test.db'}")
+    async_engine = db.dbfacade.async_session_maker.kw["bind"]
+    return StatementCounter(async_engine.sync_engine)
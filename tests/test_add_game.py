@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+from db.dbfacade import DatabaseFacade
+from game_modes import mode_registry
+
+
+# Statements for one add_game: the game, its teams as one executemany, the
+# creator's place on team 0, and reloading the game with its teams. A new
+# creator costs a lookup and an insert on top, SQLite having no upsert that
+# sqlalchemy can use here. Before add_game was a single transaction, it took
+# 3 commits, or 4 with a new creator, and one more statement for every
+# team.
+@pytest.mark.parametrize("mode_name", [
+    "2v2 Fixed Teams",
+    "2v2v2v2v2v2 Fixed Teams",
+])
+@pytest.mark.parametrize("creator, statements", [
+    ("new", 7),
+    ("cached", 5),
+])
+def test_add_game_is_one_transaction(database, mode_name, creator,
+                                     statements):
+    async def run():
+        if creator == "cached":
+            await DatabaseFacade.get_player_id_by_did("1")
+
+        database.reset()
+        game = await DatabaseFacade.add_game(
+            "1",
+            "PC",
+            mode_registry.get(mode_name),
+            ""
+        )
+        return game
+
+    game = asyncio.run(run())
+    assert database.commits == 1
+    assert database.statements == statements
+    assert game.player_number == 1
@@ -0,0 +1,77 @@
+import asyncio
+import random
+from typing import Optional
+from db.dbfacade import DatabaseFacade
+from game_locks import GameLocks
+from game_modes import mode_registry
+
+
+async def _join(game_locks: GameLocks, game_id: int,
+                player_id: int) -> Optional[bool]:
+    """
+    What the join reaction does: check the fill under the game's lock, then
+    join, with a discord round trip's worth of waiting in between. Returns
+    None if the fill check turned the player away, otherwise whether the
+    database let them in.
+    """
+    async with game_locks.hold(game_id):
+        game = await DatabaseFacade.get_game_by_id(game_id, profile="teams")
+        await asyncio.sleep(random.random() * 0.002)
+        if game.is_full():
+            return None
+        return await DatabaseFacade.add_player_to_game(game_id, player_id) \
+            is not None
+
+
+def test_concurrent_joins_fill_lobby_exactly(database):
+    game_locks = GameLocks()
+
+    async def run():
+        game = await DatabaseFacade.add_game(
+            "1",
+            "PC",
+            mode_registry.get("4v4 Fixed Teams"),
+            ""
+        )
+        # players exist up front, so that only the joins race
+        player_ids = [
+            await DatabaseFacade.get_player_id_by_did(str(player_did))
+            for player_did in range(2, 52)
+        ]
+
+        joins = await asyncio.gather(*[
+            _join(game_locks, game.id, player_id) for player_id in player_ids
+        ])
+        game = await DatabaseFacade.get_game_by_id(game.id, profile="roster")
+        return game, joins
+
+    game, joins = asyncio.run(run())
+    # With the lock, the fill check alone keeps the lobby from overfilling;
+    # the database never has to turn anyone away.
+    assert joins.count(True) == 7
+    assert joins.count(False) == 0
+    assert game.player_number == 8
+    assert len(game.teams[0].players) == 8
+    assert len(game_locks.locks) == 0
+
+
+def test_join_into_full_game_is_refused(database):
+    async def run():
+        game = await DatabaseFacade.add_game(
+            "1",
+            "PC",
+            mode_registry.get("1v1"),
+            ""
+        )
+        second = await DatabaseFacade.get_player_id_by_did("2")
+        third = await DatabaseFacade.get_player_id_by_did("3")
+
+        assert await DatabaseFacade.add_player_to_game(game.id, second) \
+            is not None
+        # no fill check first, as for a join racing another process
+        assert await DatabaseFacade.add_player_to_game(game.id, third) is None
+        return await DatabaseFacade.get_game_by_id(game.id, profile="roster")
+
+    game = asyncio.run(run())
+    assert game.player_number == 2
+    assert len(game.teams[0].players) == 2
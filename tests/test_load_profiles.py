@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from db.dbfacade import DatabaseFacade
+from game_modes import mode_registry
+
+
+async def _full_game():
+    """
+    A 4v4 game with its creator and seven more players, half of them on
+    team 1, in channel "channel".
+    """
+    game = await DatabaseFacade.add_game(
+        "1",
+        "PC",
+        mode_registry.get("4v4 Fixed Teams"),
+        ""
+    )
+    for player_did in range(2, 9):
+        player_id = await DatabaseFacade.get_player_id_by_did(str(player_did))
+        await DatabaseFacade.add_player_to_game(game.id, player_id)
+        if player_did % 2 == 0:
+            await DatabaseFacade.add_player_to_team(game.id, 1, player_id)
+    await DatabaseFacade.update_game(game.id, channel_did="channel")
+    return game
+
+
+def _read(game, profile: str) -> None:
+    """
+    Touches everything the commands using the profile read, which raises if
+    the profile did not load it.
+    """
+    if profile in ("teams", "roster", "summary"):
+        [team.size for team in game.teams]
+    if profile in ("roster", "summary"):
+        [player.did for team in game.teams for player in team.players]
+    if profile == "summary":
+        str(game)
+
+
+@pytest.mark.parametrize("profile, statements", [
+    # !leave, !kick, !delete
+    ("bare", 1),
+    # the join reaction
+    ("teams", 2),
+    # !teams, !start
+    ("roster", 2),
+    # !showgame
+    ("summary", 2),
+])
+def test_profile_statement_count(database, profile, statements):
+    async def run():
+        await _full_game()
+
+        database.reset()
+        game = await DatabaseFacade.get_game_by_channel_did(
+            "channel",
+            profile=profile
+        )
+        _read(game, profile)
+        return database.statements
+
+    assert asyncio.run(run()) == statements
+
+
+def test_team_switch_statement_count(database):
+    async def run():
+        game = await _full_game()
+        player_id = await DatabaseFacade.get_player_id_by_did("3")
+
+        database.reset()
+        assert await DatabaseFacade.add_player_to_team(game.id, 2, player_id)
+        return database.statements
+
+    # read the target team, find the player's team, claim the game's version,
+    # delete the old membership and insert the new one
+    assert asyncio.run(run()) == 5